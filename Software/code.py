@@ -2,21 +2,251 @@ import json
 import time
 import errno
 import os
+import gc
+import asyncio
+import array
+import binascii
+import ipaddress
+import random
 import board
 import neopixel
+import neopixel_write
 import wifi
 import ssl
 import socketpool
 import adafruit_requests
-from adafruit_httpserver import Server, Request, Response, JSONResponse, POST, GET
+from adafruit_httpserver import Server, Request, Response, FileResponse, JSONResponse, SSEResponse, Status, POST, GET
 
 # =========================
 #   Konfiguration
 # =========================
 HTTP_TIMEOUT = 2              # kürzerer Timeout -> Webserver bleibt reaktionsfähig
-CHECK_INTERVAL = 60           # Sekunden zwischen Twitch-Zyklen
-STARTUP_GRACE_SEC = 10        # reine Zeit-Schonfrist nach Boot (ohne UI-Abhängigkeit)
-WEB_LOCK_DURATION_SEC = 20    # Twitch-Pause nach JEDEM Webrequest
+POLL_LIVE_SEC = 90            # angezeigter Live-Kanal: langsam nachprüfen
+POLL_PREEMPT_SEC = 30         # offline, aber wichtiger als der angezeigte Kanal: schnell
+POLL_BASE_SEC = 45            # nichts live: höchste Priorität alle 45 s ...
+POLL_PRIORITY_STEP_SEC = 15   # ... jede Stufe darunter 15 s später
+POLL_LOW_SEC = 180            # unwichtiger als der angezeigte Kanal: kann nichts ändern
+POLL_JITTER = 0.1             # ±10 % Zufall gegen Gleichtakt (mehrere Schilder, Twitch)
+POLL_COALESCE_SEC = 15        # fast fällige Kanäle in dieselbe Anfrage packen
+POLL_BUDGET_PER_MIN = 10      # max. Helix-Anfragen pro Minute (alle Kanäle zusammen)
+RATELIMIT_RESERVE = 5         # so viele Helix-Punkte nie selbst verbrauchen (401-Retry, Puffer)
+RATELIMIT_WINDOW_SEC = 60     # Helix füllt den Bucket pro Minute auf
+KEEPALIVE_MAX_IDLE_SEC = 300  # länger ungenutzte Twitch-Verbindungen nicht mehr probieren
+METRICS_ENABLED = True        # Messpunkte für /metrics; False = Funktionen bleiben unverpackt
+TOKEN_CACHE_FILE = "token.json"  # App-Token überlebt Neustarts (gültig ~60 Tage)
+STATE_FILE = "state.json"     # zuletzt angezeigter Kanal -> sofort wieder anzeigen nach dem Einschalten
+STATE_MAX_AGE_SEC = 6 * 3600  # älterer Stand wird verworfen, sobald die Uhr gestellt ist
+STATE_REFRESH_SEC = 3600      # solange ein Kanal live ist: state.json so oft auffrischen ("seen")
+WIFI_CACHE_FILE = "wifi.json" # letzter guter Access Point (BSSID/Kanal) + DHCP-Lease für schnellen Reconnect
+WEB_PRIORITY_QUIET_SEC = 0.5  # Twitch wartet, bis der Webserver so lange ruhig war ...
+TWITCH_MAX_DEFER_SEC = 10     # ... aber höchstens so lange -> Anzeige nie älter als Intervall + 10 s
+NOT_MODIFIED_304 = Status(304, "Not Modified")
+HTTP_POLL_INTERVAL = 0.005    # Takt des Webserver-Tasks
+TASK_ERROR_BACKOFF_SEC = 1    # nach einer unerwarteten Ausnahme in einer Task-Schleife so lange pausieren
+LED_FRAME_INTERVAL = 0.004    # kürzester Takt des LED-Tasks (ein Frame pro Tick)
+LED_IDLE_INTERVAL = 0.05      # Takt des LED-Tasks, wenn kein Effekt läuft
+LED_MAX_FPS = 60              # höchstens so viele Frames/s an den Strip (config.json "led": {"max_fps": ...})
+LED_GAMMA = 1.0               # Gamma-Korrektur der LED-Werte (config.json "led": {"gamma": 2.2}); 1.0 = aus
+WIFI_CHECK_INTERVAL = 1       # Sekunden zwischen WLAN-Prüfungen (nur Statusabfrage, kostet nichts)
+WIFI_PING_SEC = 30            # so oft das Gateway anpingen (Funkloch, obwohl radio.connected noch True ist)
+WIFI_PING_TIMEOUT = 0.3       # Sekunden; blockiert, daher kurz
+WIFI_PING_RETRY_SEC = 2       # nach einem verlorenen Ping schnell nachfassen ...
+WIFI_PING_FAILS = 2           # ... so viele verlorene Pings hintereinander -> Verbindung gilt als weg
+WIFI_FAST_TIMEOUT = 5         # Sekunden für den gezielten Reconnect (BSSID + Kanal)
+WIFI_BACKOFF_BASE = 1         # Sekunden; verdoppelt sich je Fehlversuch ...
+WIFI_BACKOFF_MAX = 60         # ... bis höchstens hierhin
+WIFI_BACKOFF_JITTER = 0.25    # +-25 %, damit nach Stromausfall nicht alle Schilder gleichzeitig anklopfen
+SSE_MAX_CLIENTS = 3           # offene /events-Verbindungen; die älteste fliegt raus
+SSE_PUSH_INTERVAL = 0.25      # Änderungen so lange sammeln und gebündelt senden
+SSE_KEEPALIVE_SEC = 15        # Ping, damit tote Verbindungen auffallen
+FLEET_GROUP = "239.255.42.99" # Flottenmodus: Multicast-Gruppe/Port (config.json "fleet" kann überschreiben)
+FLEET_PORT = 5007
+FLEET_STATE_SEC = 5           # Leader schickt den Zustand spätestens so oft (und sofort bei Änderung)
+FLEET_HELLO_SEC = 5           # Follower melden sich so oft
+FLEET_TIMEOUT_SEC = 15        # so lange still -> Gerät zählt nicht mehr (Leader-Ausfall)
+FLEET_LISTEN_SEC = 6          # nach dem Start erst zuhören, bevor man selbst Leader wird
+FLEET_FRAME_MAX = 1024        # max. Bytes je UDP-Frame; längere Kanallisten gehen auf mehrere Frames
+CONFIG_FLUSH_QUIET_SEC = 3    # config.json erst schreiben, wenn so lange keine Änderung kam
+CONFIG_FLUSH_MAX_DELAY_SEC = 30  # ... aber spätestens so lange nach der ersten Änderung
+LOG_SLOTS = 64                # Einträge im Log-Ringpuffer (die ältesten werden überschrieben)
+LOG_SLOT_BYTES = 96           # Bytes je Eintrag; längere Meldungen werden gekürzt
+LOG_LEVEL = "info"            # ab dieser Stufe in den Ringpuffer (config.json "log": {"level": ...})
+LOG_ECHO = "warn"             # ab dieser Stufe zusätzlich auf die USB-Konsole ("off" = nie)
+
+# =========================
+#   Messpunkte (/metrics, Prometheus-Textformat)
+# =========================
+METRICS_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class Histogram:
+    """Feste Buckets in ms; speichert nur Zähler, keine Einzelwerte."""
+
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_us = 0
+
+    def observe_ns(self, ns):
+        us = ns // 1000
+        self.total += 1
+        self.sum_us += us
+        i = 0
+        for ms in METRICS_BUCKETS_MS:
+            if us <= ms * 1000:
+                break
+            i += 1
+        self.counts[i] += 1
+
+_histograms = {}               # (name, labels) -> Histogram
+_counters = {}                 # (name, labels) -> int
+mem_low = None                 # kleinster gesehener gc.mem_free()-Wert
+
+def histogram(name, labels=""):
+    h = _histograms.get((name, labels))
+    if h is None:
+        h = _histograms[(name, labels)] = Histogram()
+    return h
+
+def timed(name, labels=""):
+    """Dekorator: Laufzeit in ein Histogramm. Ohne METRICS_ENABLED bleibt die Funktion unverändert."""
+    def wrap(fn):
+        if not METRICS_ENABLED:
+            return fn
+        h = histogram(name, labels)
+
+        def inner(*args, **kwargs):
+            t = time.monotonic_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                h.observe_ns(time.monotonic_ns() - t)
+        return inner
+    return wrap
+
+def count(name, labels=""):
+    if METRICS_ENABLED:
+        key = (name, labels)
+        _counters[key] = _counters.get(key, 0) + 1
+
+def sample_mem():
+    """gc.mem_free() merken (gibt es nur auf dem Pico, nicht unter CPython)."""
+    global mem_low
+    mem_free = getattr(gc, "mem_free", None)
+    if not METRICS_ENABLED or mem_free is None:
+        return None
+    free = mem_free()
+    if mem_low is None or free < mem_low:
+        mem_low = free
+    return free
+
+def _metric_name(name, labels, extra=""):
+    inner = ",".join(x for x in (labels, extra) if x)
+    return "%s{%s}" % (name, inner) if inner else name
+
+def render_metrics(gauges):
+    """Alle Messwerte als Prometheus-Text; gauges = [(name, wert), ...] vom Aufrufer."""
+    out = []
+    for (name, labels), h in sorted(_histograms.items()):
+        if not h.total:
+            continue
+        acc = 0
+        for ms, n in zip(METRICS_BUCKETS_MS, h.counts):
+            acc += n
+            out.append('%s %d' % (_metric_name(name + "_bucket", labels, 'le="%g"' % (ms / 1000)), acc))
+        out.append('%s %d' % (_metric_name(name + "_bucket", labels, 'le="+Inf"'), h.total))
+        out.append('%s %.6f' % (_metric_name(name + "_sum", labels), h.sum_us / 1000000))
+        out.append('%s %d' % (_metric_name(name + "_count", labels), h.total))
+    for (name, labels), n in sorted(_counters.items()):
+        out.append('%s %d' % (_metric_name(name, labels), n))
+    for name, value in gauges:
+        if value is not None:
+            out.append('%s %s' % (name, value))
+    out.append("")
+    return "\n".join(out)
+
+# =========================
+#   Protokoll: Ringpuffer im RAM (GET /logs), Konsole optional
+# =========================
+LOG_LEVELS = ("debug", "info", "warn", "error")
+
+def _log_level(name, default):
+    if name == "off":
+        return len(LOG_LEVELS)
+    return LOG_LEVELS.index(name) if name in LOG_LEVELS else default
+
+class RingLog:
+    """Protokoll fester Größe: alle Puffer werden einmal angelegt und dann nur überschrieben.
+
+    Formatiert wird erst, wenn die Stufe aktiv ist: log.info("HTTP %d", status). Auf die
+    Konsole geht nur, was mindestens die Echo-Stufe hat – USB-CDC-Ausgaben können blockieren.
+    """
+
+    def __init__(self, slots=LOG_SLOTS, slot_bytes=LOG_SLOT_BYTES):
+        self._slots = slots
+        self._width = slot_bytes
+        self._text = bytearray(slots * slot_bytes)
+        self._len = array.array("H", [0] * slots)
+        self._ms = array.array("L", [0] * slots)
+        self._lvl = bytearray(slots)
+        self._t0 = time.monotonic_ns()
+        self.seq = 0                  # Nummer des letzten Eintrags (Cursor für /logs?since=)
+        self.level = _log_level(LOG_LEVEL, 1)
+        self.echo = _log_level(LOG_ECHO, 2)
+
+    def configure(self, cfg):
+        self.level = _log_level(cfg.get("level"), self.level)
+        self.echo = _log_level(cfg.get("echo"), self.echo)
+
+    def _emit(self, level, msg, args, echo):
+        if level < self.level and level < self.echo and not echo:
+            return
+        if args:
+            try:
+                msg = msg % args
+            except Exception:
+                msg = "%s %r" % (msg, args)
+        if echo or level >= self.echo:
+            print(msg)
+        if level < self.level:
+            return
+        data = msg.encode("utf-8")
+        n = min(len(data), self._width)
+        while 0 < n < len(data) and (data[n] & 0xC0) == 0x80:
+            n -= 1                    # nicht mitten in einem UTF-8-Zeichen abschneiden
+        i = self.seq % self._slots
+        o = i * self._width
+        self._text[o:o + n] = memoryview(data)[:n]
+        self._len[i] = n
+        self._lvl[i] = level
+        self._ms[i] = ((time.monotonic_ns() - self._t0) // 1000000) & 0xFFFFFFFF   # läuft nach ~49 Tagen über
+        self.seq += 1
+
+    def debug(self, msg, *args, echo=False):
+        self._emit(0, msg, args, echo)
+
+    def info(self, msg, *args, echo=False):
+        self._emit(1, msg, args, echo)
+
+    def warn(self, msg, *args, echo=False):
+        self._emit(2, msg, args, echo)
+
+    def error(self, msg, *args, echo=False):
+        self._emit(3, msg, args, echo)
+
+    def read(self, since=0, min_level=0):
+        """Einträge nach Nummer since: {"next": Cursor, "dropped": überschrieben, "lines": [...]}."""
+        first = max(since, self.seq - self._slots, 0)
+        lines = []
+        for s in range(first, self.seq):
+            i = s % self._slots
+            if self._lvl[i] < min_level:
+                continue
+            o = i * self._width
+            lines.append([s + 1, self._ms[i], LOG_LEVELS[self._lvl[i]],
+                          str(self._text[o:o + self._len[i]], "utf-8")])
+        return {"next": self.seq, "dropped": max(0, first - since), "lines": lines}
+
+log = RingLog()
 
 # =========================
 #   JSON laden/speichern
@@ -25,6 +255,7 @@ def load_json(filename):
     with open(filename, "r") as f:
         return json.load(f)
 
+@timed("onair_flash_write_seconds")
 def save_json(filename, data):
     tmp = filename + ".tmp"
     try:
@@ -42,14 +273,58 @@ def save_json(filename, data):
                 os.remove(tmp)
         except Exception:
             pass
-        print("save_json Fehler:", e)
+        log.error("save_json Fehler: %s", e)
         return False
 
+class ConfigStore:
+    """Write-behind für eine JSON-Datei: Änderungen sammeln, gebündelt (atomar) schreiben."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+        self.pending = 0               # Änderungen seit dem letzten erfolgreichen Schreiben
+        self.writes = 0
+        self.last_error = None
+        self._first_change = 0.0
+        self._last_change = 0.0
+        self._retry_at = 0.0
+
+    def mark_dirty(self):
+        now = time.monotonic()
+        if not self.pending:
+            self._first_change = now
+        self._last_change = now
+        self.pending += 1
+
+    def due(self, now):
+        if not self.pending or now < self._retry_at:
+            return False
+        return ((now - self._last_change) >= CONFIG_FLUSH_QUIET_SEC or
+                (now - self._first_change) >= CONFIG_FLUSH_MAX_DELAY_SEC)
+
+    def flush(self):
+        """Sofort schreiben (falls nötig). False, wenn das Dateisystem nicht schreibbar ist."""
+        if not self.pending:
+            return True
+        if save_json(self.filename, self.data):
+            self.pending = 0
+            self.writes += 1
+            self.last_error = None
+            return True
+        self.last_error = "read_only_fs"
+        self._retry_at = time.monotonic() + CONFIG_FLUSH_MAX_DELAY_SEC
+        return False
+
+    def status(self):
+        return {"pending": self.pending, "writes": self.writes, "last_error": self.last_error}
+
 # Zugangsdaten + Konfiguration
 secrets = load_json("secrets.json")
 config = load_json("config.json")
+log.configure(config.get("log", {}))
 if "ui" not in config:
     config["ui"] = {"theme": "light"}
+config_store = ConfigStore("config.json", config)
 
 # =========================
 #   NeoPixel-Setup
@@ -66,72 +341,684 @@ letters = {
     "I": range(33, 38),
     "R": range(38, 50),
 }
+LETTER_KEYS = ["O", "N", "A", "I", "R"]   # feste Reihenfolge (Effekt-Tabellen, Web-UI)
 
 last_online_channel = None
+display_dirty = False          # Twitch-Task meldet Kanalwechsel an den LED-Task
+error_pending = False          # Twitch-Task meldet Fehler an den LED-Task
+eventsub = None                # EventSub-Sitzung (Push-Modus), wird in main() angelegt
+fleet = None                   # Flottenmodus (Leader/Follower), nur wenn in config.json aktiviert
 
 # Start-/Steuer-Flags
-boot_time = 0.0
+boot_time = time.monotonic()
+boot_phases = {}               # Phase -> ms seit boot_time (Messung "Zeit bis richtige Anzeige")
+state_dirty = False            # angezeigter Kanal geändert -> state.json schreiben
+state_saved_at = 0.0           # monotonic des letzten save_state()
 ui_config_seen = True          # >>> NEU: direkt True, damit Twitch auch ohne Webaufruf startet
-web_lock_until = 0.0           # wird bei Webzugriff gesetzt
+last_http_activity = 0.0       # monotonic des letzten Webrequests (Web hat Vorrang vor Twitch)
+
+def mark_boot(phase):
+    """Zeitpunkt einer Boot-Phase festhalten (nur das erste Mal)."""
+    if phase not in boot_phases:
+        boot_phases[phase] = int((time.monotonic() - boot_time) * 1000)
+        log.info("Boot: %s %d ms", phase, boot_phases[phase])
+
+# =========================
+#   Frame-Cache (fertige Kanal-Frames im Byte-Format des Strips)
+# =========================
+FRAME_CACHE_MAX = 8           # max. gecachte Kanal-Frames (je 150 Byte bei 50 RGB-LEDs)
+
+pixel_order = getattr(pixels, "byteorder", "GRB")
+bpp = len(pixel_order)
+_offset_r = pixel_order.index("R")
+_offset_g = pixel_order.index("G")
+_offset_b = pixel_order.index("B")
+
+def _gamma_table(gamma):
+    """Linearer Wert 0..255 -> LED-Byte; 256 Einträge, einmal beim Start berechnet."""
+    if gamma == 1.0:
+        return bytes(range(256))
+    return bytes(int(round(255 * (i / 255) ** gamma)) for i in range(256))
+
+_GAMMA = _gamma_table(float(config.get("led", {}).get("gamma", LED_GAMMA)))
+
+def _fixed(bright):
+    """Helligkeit 0..1 -> Festkomma 0..256 (Farbwert * f >> 8)."""
+    return max(0, min(256, int(bright * 256 + 0.5)))
+
+def _led_value(c, f):
+    """Farbwert * Helligkeit (Festkomma) -> LED-Byte über die Gamma-Tabelle."""
+    # Werte aus einer von Hand bearbeiteten config.json können außerhalb liegen -> begrenzen
+    return _GAMMA[max(0, min(255, (int(c) * f) >> 8))]
+
+def build_channel_frame(channel_cfg):
+    """Rechnet Farbe*Helligkeit einmal pro Buchstabe und füllt den kompletten Frame."""
+    frame = bytearray(num_pixels * bpp)
+    for letter_key, idxs in letters.items():
+        lc = channel_cfg["letters"].get(letter_key, {})
+        color = lc.get("color", [0, 0, 0])
+        f = _fixed(lc.get("brightness", 0.5))
+        r, g, b = _led_value(color[0], f), _led_value(color[1], f), _led_value(color[2], f)
+        for i in idxs:
+            o = i * bpp
+            frame[o + _offset_r] = r
+            frame[o + _offset_g] = g
+            frame[o + _offset_b] = b
+    return frame
+
+class FrameCache:
+    """LRU-Cache Kanalname -> Frame; Einträge werden bei Konfig-Änderungen verworfen."""
+
+    def __init__(self, max_frames=FRAME_CACHE_MAX):
+        self._max = max_frames
+        self._frames = {}
+        self._lru = []             # Namen, zuletzt benutzt am Ende
+
+    def get(self, channel_cfg):
+        name = channel_cfg["name"]
+        frame = self._frames.get(name)
+        if frame is None:
+            frame = build_channel_frame(channel_cfg)
+            self._frames[name] = frame
+            if len(self._lru) >= self._max:
+                self._frames.pop(self._lru.pop(0), None)
+        else:
+            self._lru.remove(name)
+        self._lru.append(name)
+        return frame
+
+    def invalidate(self, name=None):
+        """Einen Kanal (oder mit None alle) verwerfen."""
+        if name is None:
+            self._frames = {}
+            self._lru = []
+        elif name in self._frames:
+            del self._frames[name]
+            self._lru.remove(name)
+
+frame_cache = FrameCache()
+
+@timed("onair_led_show_seconds")
+def show_frame(frame):
+    """Fertigen Frame in einem Rutsch ausgeben (entspricht pixels.show() mit brightness=1.0)."""
+    neopixel_write.neopixel_write(pixels.pin, frame)
+
+# =========================
+#   Render-Schicht (eigener Pixelpuffer, Dirty-Tracking je Buchstabe, FPS-Grenze)
+# =========================
+class Renderer:
+    """Besitzt den Pixelpuffer (Byte-Reihenfolge des Strips). Effekte zeichnen nur hinein;
+    present() überträgt ihn, wenn sich ein Buchstabe geändert hat und die FPS-Grenze es erlaubt.
+    """
+
+    def __init__(self, max_fps=LED_MAX_FPS):
+        self.buf = bytearray(num_pixels * bpp)
+        # Buchstaben sind zusammenhängende LED-Bereiche -> ein Byte-Bereich je Buchstabe
+        self._spans = {k: (idxs[0] * bpp, (idxs[-1] + 1) * bpp) for k, idxs in letters.items()}
+        self._span_list = tuple((k, a, b) for k, (a, b) in self._spans.items())
+        self.dirty = set()            # Buchstaben, die sich seit der letzten Ausgabe geändert haben
+        self._changed = False         # seit dem letzten present() gezeichnet und anders als vorher
+        self._waiting = False         # geänderter Frame wartet auf die FPS-Grenze
+        self._next_at = 0.0
+        self._gap = 0.0
+        self.set_fps(max_fps)
+        self.rendered = 0             # an den Strip übertragen
+        self.unchanged = 0            # Effekt-Schritt ohne Änderung -> nicht übertragen
+        self.dropped = 0              # von einem neueren Frame überholt, bevor er raus durfte
+
+    def set_fps(self, fps):
+        self._gap = 1 / max(1, fps)
+
+    @property
+    def frame_time(self):
+        """Kürzester sinnvoller Effekt-Schritt: schneller kommt ohnehin kein Frame raus."""
+        return self._gap
+
+    def _mark(self, key):
+        self.dirty.add(key)
+        self._changed = True
+
+    # Die Schreibwege arbeiten Byte für Byte direkt in self.buf: keine Slices,
+    # keine bytes-Objekte – sie laufen in jedem Effekt-Schritt.
+    def set_letter(self, key, r, g, b):
+        a, e = self._spans[key]
+        buf = self.buf
+        # Buchstaben sind immer einfarbig (alle Schreibwege setzen ganze Buchstaben)
+        # -> der erste Pixel genügt für den Vergleich
+        if buf[a + _offset_r] == r and buf[a + _offset_g] == g and buf[a + _offset_b] == b:
+            return
+        o = a
+        while o < e:
+            buf[o + _offset_r] = r
+            buf[o + _offset_g] = g
+            buf[o + _offset_b] = b
+            o += bpp
+        self._mark(key)
+
+    def fill(self, color):
+        r, g, b = int(color[0]), int(color[1]), int(color[2])
+        for key in LETTER_KEYS:
+            self.set_letter(key, r, g, b)
+
+    def blit(self, frame):
+        """Kompletten Frame (z. B. aus dem FrameCache) übernehmen."""
+        buf = self.buf
+        for key, a, e in self._span_list:
+            changed = False
+            o = a
+            while o < e:
+                if buf[o] != frame[o]:
+                    buf[o] = frame[o]
+                    changed = True
+                o += 1
+            if changed:
+                self._mark(key)
+
+    def present(self, now, new_frame=True):
+        """Nach einem Effekt-Schritt (new_frame) oder zum Nachreichen aufrufen.
+
+        Liefert die Sekunden, bis ein wartender Frame raus darf, sonst None.
+        """
+        changed, self._changed = self._changed, False
+        if new_frame:
+            if not changed:
+                self.unchanged += 1
+            elif self._waiting:
+                self.dropped += 1
+        if not self.dirty:
+            self._waiting = False
+            return None
+        if now < self._next_at:
+            self._waiting = True
+            return self._next_at - now
+        show_frame(self.buf)
+        self.rendered += 1
+        self.dirty = set()
+        self._waiting = False
+        self._next_at = now + self._gap
+        return None
+
+    def status(self):
+        return {"rendered": self.rendered, "unchanged": self.unchanged, "dropped": self.dropped,
+                "max_fps": round(1 / self._gap)}
+
+renderer = Renderer(config.get("led", {}).get("max_fps", LED_MAX_FPS))
 
 # =========================
 #   LED-Effekte
 # =========================
-def error_effect():
-    for _ in range(2):
-        pixels.fill([255, 0, 0]); pixels.show(); time.sleep(0.15)
-        pixels.fill([0, 0, 0]);   pixels.show(); time.sleep(0.15)
+# Effekte sind Generatoren: jeder Schritt zeichnet EIN Frame und liefert per
+# yield, wie lange es stehen bleiben soll. Abgespielt werden sie vom Animator.
+#
+# Effekte für Kanalwechsel, Standby und Fehler sind Daten (config.json "effects"):
+# Keyframes je Buchstabe, Easing und Dauer. Beim ersten Abspielen werden sie zu
+# einer Frame-Tabelle kompiliert (bytearray, 3 Byte RGB je Buchstabe und Frame);
+# das Abspielen ist danach nur noch Indexzugriff.
+#
+#   "name": {"step": 0.04,          Sekunden je Frame
+#            "duration": 0.4,       Länge eines Durchlaufs in Sekunden
+#            "repeat": 2,           Durchläufe
+#            "easing": "linear",    linear | ease_in | ease_out | ease_in_out | step
+#            "letters": {"O": [[0, [255, 0, 0]], [0.2, "channel", 0.5]], "*": [...]}}
+#
+# Ein Keyframe ist [Zeit in s, Farbe, Helligkeit (optional, Standard 1)]. Farbe ist
+# [r, g, b], "offline" (Offline-Farbe) oder "channel" (Farbe*Helligkeit des Buchstabens
+# im angezeigten Kanal). "*" gilt für alle Buchstaben ohne eigene Keyframes.
+EFFECT_MAX_FRAMES = 400       # Obergrenze je Effekt (400 Frames = 6 KB Tabelle)
+EFFECT_CACHE_MAX = 6          # max. gecachte Tabellen (je Effekt, Offline-Farbe, Kanal)
+EFFECT_SLOTS = ("change", "standby", "error")
+
+def _knight_rider_keys():
+    # O N A I R R I A N O: jeder Buchstabe leuchtet in zwei der zehn Frames rot
+    keys = {}
+    for i, key in enumerate(LETTER_KEYS):
+        on = (i, 9 - i)
+        keys[key] = [[0, [0, 0, 0]]] + [kf for f in on for kf in ([f * 0.04, [255, 0, 0]], [(f + 1) * 0.04, [0, 0, 0]])]
+    return keys
+
+DEFAULT_EFFECTS = {
+    "lauflicht": {"step": 0.04, "duration": 0.4, "repeat": 2, "easing": "step",
+                  "letters": _knight_rider_keys()},
+    "puls": {"step": 0.004, "duration": 0.12, "easing": "linear",
+             "letters": {"*": [[0, "offline", 0.2], [0.12, "offline", 0.4]]}},
+    "blinken": {"step": 0.15, "duration": 0.6, "easing": "step",
+                "letters": {"*": [[0, [255, 0, 0]], [0.15, [0, 0, 0]], [0.3, [255, 0, 0]], [0.45, [0, 0, 0]]]}},
+    "einblenden": {"step": 0.04, "duration": 2.0, "easing": "ease_out",
+                   "letters": {k: [[0, [0, 0, 0]], [i * 0.4, [0, 0, 0]], [(i + 1) * 0.4, "channel"]]
+                               for i, k in enumerate(LETTER_KEYS)}},
+}
+DEFAULT_EFFECT_SLOTS = {"change": "lauflicht", "standby": "puls", "error": "blinken"}
+
+_EASINGS = {
+    "linear": lambda x: x,
+    "ease_in": lambda x: x * x,
+    "ease_out": lambda x: x * (2 - x),
+    "ease_in_out": lambda x: x * x * (3 - 2 * x),
+    "step": None,
+}
+
+def effect_names():
+    names = set(DEFAULT_EFFECTS)
+    names.update(config.get("effects", {}))
+    return sorted(names)
+
+def effect_spec(name):
+    return config.get("effects", {}).get(name) or DEFAULT_EFFECTS.get(name)
+
+def slot_effect_name(slot):
+    name = config.get("effect_slots", {}).get(slot)
+    return name if effect_spec(name) else DEFAULT_EFFECT_SLOTS[slot]
+
+def _keyframe_color(kf, key, offline, channel_cfg):
+    color = kf[1]
+    if color == "offline":
+        color = offline
+    elif color == "channel":
+        lc = channel_cfg["letters"].get(key, {}) if channel_cfg else {}
+        # gleiche Festkomma-Rechnung wie build_channel_frame -> Übergänge enden exakt auf dem Kanal-Frame
+        f = _fixed(lc.get("brightness", 0.5))
+        color = [(int(c) * f) >> 8 for c in lc.get("color", [0, 0, 0])]
+    bright = float(kf[2]) if len(kf) > 2 else 1.0
+    return tuple(max(0.0, min(255.0, float(c) * bright)) for c in color[:3])
+
+def compile_effect(spec, offline=(50, 50, 50), channel_cfg=None, min_step=0):
+    """Effekt-Beschreibung -> (frames, step, repeat). Wirft ValueError/KeyError/TypeError bei Unsinn.
+
+    Ist step kleiner als min_step (Frame-Zeit des Renderers), wird gröber abgetastet:
+    so wenige Frames, dass jeder mindestens min_step steht, bei gleicher Gesamtdauer.
+    """
+    step = float(spec.get("step", 0.04))
+    if step <= 0:
+        raise ValueError("step")
+    duration = float(spec.get("duration", step))
+    n = int(round(duration / step))
+    if step < min_step and n > 1:
+        n = max(1, int(duration / min_step))
+        step = duration / n
+    repeat = int(spec.get("repeat", 1))
+    if not (0 < n <= EFFECT_MAX_FRAMES) or not (0 < repeat <= 100):
+        raise ValueError("duration/repeat")
+    ease = _EASINGS[spec.get("easing", "linear")]
+    lspec = spec.get("letters", {})
+    width = len(LETTER_KEYS) * 3
+    frames = bytearray(n * width)
+    for li, key in enumerate(LETTER_KEYS):
+        kfs = lspec.get(key) or lspec.get("*") or [[0, [0, 0, 0]]]
+        # Zeiten auf Frame-Nummern runden: keine Float-Vergleiche beim Interpolieren.
+        # Nur nach der Zeit sortieren (stabil): gleiche Zeit -> Reihenfolge aus der Definition
+        points = sorted(((int(round(float(kf[0]) / step)), _keyframe_color(kf, key, offline, channel_cfg))
+                         for kf in kfs), key=lambda p: p[0])
+        k = 0
+        for i in range(n):
+            while k + 1 < len(points) and points[k + 1][0] <= i:
+                k += 1
+            f0, c0 = points[k]
+            if ease is None or k + 1 == len(points) or i < f0:
+                c = c0
+            else:
+                f1, c1 = points[k + 1]
+                x = ease((i - f0) / (f1 - f0))
+                c = (c0[0] + (c1[0] - c0[0]) * x, c0[1] + (c1[1] - c0[1]) * x, c0[2] + (c1[2] - c0[2]) * x)
+            o = i * width + li * 3
+            frames[o], frames[o + 1], frames[o + 2] = _GAMMA[int(c[0])], _GAMMA[int(c[1])], _GAMMA[int(c[2])]
+    return frames, step, repeat
+
+_effect_cache = {}            # (name, offline, kanal) -> (frames, step, repeat)
+
+def effect_table(name, channel_cfg=None, offline=None):
+    """Kompilierte Tabelle aus dem Cache; bei kaputter Definition der Standard-Effekt gleichen Namens (oder Puls)."""
+    if offline is None:
+        offline = config.get("offline_color", [50, 50, 50])
+    key = (name, tuple(offline), channel_cfg["name"] if channel_cfg else None)
+    table = _effect_cache.get(key)
+    if table is None:
+        try:
+            table = compile_effect(effect_spec(name), offline, channel_cfg, renderer.frame_time)
+        except Exception as e:
+            log.warn("Effekt %s ungültig: %s", name, e)
+            table = compile_effect(DEFAULT_EFFECTS.get(name, DEFAULT_EFFECTS["puls"]), offline, channel_cfg,
+                                   renderer.frame_time)
+        if len(_effect_cache) >= EFFECT_CACHE_MAX:
+            _effect_cache.clear()
+        _effect_cache[key] = table
+    return table
+
+def invalidate_effects():
+    _effect_cache.clear()
+
+def table_effect(table):
+    """Spielt eine kompilierte Tabelle ab: pro Frame fünf Buchstabenfarben in den Renderer."""
+    frames, step, repeat = table
+    count = len(LETTER_KEYS)
+    width = count * 3
+    for _ in range(repeat):
+        for o in range(0, len(frames), width):
+            for li in range(count):
+                p = o + li * 3
+                renderer.set_letter(LETTER_KEYS[li], frames[p], frames[p + 1], frames[p + 2])
+            yield step
+
+def slot_effect(slot, channel_cfg=None, offline=None):
+    return table_effect(effect_table(slot_effect_name(slot), channel_cfg, offline))
+
+# Verbindungs-Puls: 0..255 in 16er-Schritten, /4, gelb (einmalig berechnet)
+_CONNECTING_UP = tuple((_GAMMA[b // 4], _GAMMA[b // 4], 0) for b in range(0, 256, 16))
+_CONNECTING_DOWN = tuple((_GAMMA[b // 4], _GAMMA[b // 4], 0) for b in range(255, -1, -16))
 
 def connecting_effect():
+    # 8 ms je Stufe; bei niedrigerer Bildrate Stufen auslassen statt langsamer werden
+    skip = max(1, int(round(renderer.frame_time / 0.008)))
     for _ in range(2):
-        for b in range(0, 256, 16):
-            pixels.fill([b // 4, b // 4, 0]); pixels.show(); time.sleep(0.008)
-        for b in range(255, -1, -16):
-            pixels.fill([b // 4, b // 4, 0]); pixels.show(); time.sleep(0.008)
-
-def standby_effect(offline_color):
-    base_b = 0.2; pulse = 0.2; steps = 30
-    for s in range(0, steps):
-        b = base_b + pulse * (s / steps)
-        col = [int(c * b) for c in offline_color]
-        pixels.fill(col); pixels.show()
-        time.sleep(0.004)
+        for i in range(0, len(_CONNECTING_UP), skip):
+            renderer.fill(_CONNECTING_UP[i]); yield 0.008 * skip
+        for i in range(0, len(_CONNECTING_DOWN), skip):
+            renderer.fill(_CONNECTING_DOWN[i]); yield 0.008 * skip
 
 def set_letter_colors(channel_cfg):
-    for letter_key, idxs in letters.items():
-        lc = channel_cfg["letters"].get(letter_key, {})
-        color = lc.get("color", [0, 0, 0])
-        bright = lc.get("brightness", 0.5)
-        adj = [int(c * bright) for c in color]
-        for i in idxs:
-            pixels[i] = adj
-    pixels.show()
+    renderer.blit(frame_cache.get(channel_cfg))
+
+def letters_effect(channel_cfg):
+    set_letter_colors(channel_cfg)
+    yield 0
+
+def chain(*effects):
+    for effect in effects:
+        yield from effect
+
+class Animator:
+    """Spielt Effekte Frame für Frame ab: tick() rechnet höchstens ein Frame."""
+
+    def __init__(self):
+        self._current = None
+        self._queue = []
+        self._idle = None          # Fabrik für den Effekt, wenn nichts ansteht
+        self._next_at = 0.0
+        self.stepped = False       # tick() hat einen Effekt-Schritt gerechnet
+
+    def play(self, effect, interrupt=False):
+        """Effekt anhängen; mit interrupt=True wird Laufendes + Warteschlange verworfen."""
+        if interrupt:
+            self._queue = []
+            self._current = effect
+            self._next_at = 0.0
+        else:
+            self._queue.append(effect)
+
+    def set_idle(self, factory):
+        """Effekt, der endlos wiederholt wird, solange nichts anderes ansteht (oder None)."""
+        self._idle = factory
+
+    def stop(self):
+        self._queue = []
+        self._current = None
+        self._next_at = 0.0
+
+    @property
+    def busy(self):
+        return (self._current is not None) or bool(self._queue)
+
+    def tick(self, now):
+        """Ein Frame weiterschalten, falls fällig. Liefert Sekunden bis zum nächsten Frame."""
+        if now < self._next_at:
+            return self._next_at - now
+        if self._current is None:
+            if self._queue:
+                self._current = self._queue.pop(0)
+            elif self._idle:
+                self._current = self._idle()
+            else:
+                return LED_IDLE_INTERVAL
+        try:
+            delay = next(self._current) or 0
+            self.stepped = True
+        except StopIteration:
+            self._current = None
+            delay = 0
+        self._next_at = now + delay
+        return delay
 
-def knight_rider_effect(color, cycles=2):
-    keys = ["O", "N", "A", "I", "R"]
-    for _ in range(cycles):
-        for k in keys + list(reversed(keys)):
-            pixels.fill([0, 0, 0])
-            for i in letters[k]:
-                pixels[i] = color
-            pixels.show()
-            time.sleep(0.04)
+animator = Animator()
 
 # =========================
 #   Netzwerk/WiFi
 # =========================
-def connect_to_wifi(max_retries=5, retry_delay=3):
-    for attempt in range(1, max_retries + 1):
+class WifiSupervisor:
+    """Verbindet und hält das WLAN: erst gezielt (gespeicherte BSSID/Kanal/Lease), sonst voll.
+
+    Fehlversuche warten exponentiell länger (mit Jitter). check() erkennt einen Verlust selbst
+    (Radio-Status + Gateway-Ping), statt auf eine gescheiterte Twitch-Anfrage zu warten.
+    Jede Verbindung wird mit Dauer und Art protokolliert (onair_wifi_connect_seconds).
+    """
+
+    def __init__(self, ssid, password, static=None):
+        self.ssid = ssid
+        self.password = password
+        self.static = static          # secrets.json "wifi": {"static": {...}} -> nie DHCP
+        self.cache = self._load()
+        self.connects = {"fast": 0, "full": 0}
+        self.failures = 0
+        self.last = None              # {"mode", "ms", "outage_ms"} der letzten Verbindung
+        self.lost_at = None           # monotonic des erkannten Verlusts
+        self._ping_at = 0.0
+        self._ping_fails = 0
+
+    def _load(self):
         try:
-            print(f"WiFi verbinden: {secrets['wifi']['ssid']} (Versuch {attempt}/{max_retries})")
-            wifi.radio.connect(secrets["wifi"]["ssid"], secrets["wifi"]["password"])
-            print("WiFi verbunden.")
+            data = load_json(WIFI_CACHE_FILE)
+            return data if data.get("ssid") == self.ssid else None
+        except Exception:
+            return None
+
+    def _save(self):
+        radio = wifi.radio
+        ap = radio.ap_info
+        if ap is None:
+            return
+        data = {"ssid": self.ssid, "bssid": binascii.hexlify(ap.bssid).decode(), "channel": ap.channel,
+                "lease": self.static or {"ipv4": str(radio.ipv4_address), "netmask": str(radio.ipv4_subnet),
+                                         "gateway": str(radio.ipv4_gateway), "dns": str(radio.ipv4_dns)}}
+        if data != self.cache:        # Flash nur bei Änderung beschreiben
+            self.cache = data
+            save_json(WIFI_CACHE_FILE, data)
+
+    @staticmethod
+    def _set_address(lease):
+        wifi.radio.set_ipv4_address(ipv4=ipaddress.ip_address(lease["ipv4"]),
+                                    netmask=ipaddress.ip_address(lease["netmask"]),
+                                    gateway=ipaddress.ip_address(lease["gateway"]),
+                                    ipv4_dns=ipaddress.ip_address(lease.get("dns") or lease["gateway"]))
+
+    def _gateway_reachable(self):
+        try:
+            return wifi.radio.ping(ipaddress.ip_address(str(wifi.radio.ipv4_gateway)),
+                                   timeout=WIFI_PING_TIMEOUT) is not None
+        except Exception:
+            return False
+
+    def _attempt(self, fast):
+        radio = wifi.radio
+        if fast:
+            # Lease vom letzten Mal statisch setzen -> kein DHCP-Roundtrip
+            self._set_address(self.static or self.cache["lease"])
+            radio.connect(self.ssid, self.password, channel=self.cache["channel"],
+                          bssid=binascii.unhexlify(self.cache["bssid"]), timeout=WIFI_FAST_TIMEOUT)
+            if not self.static:
+                reachable = self._gateway_reachable()
+                # DHCP im Hintergrund wieder anwerfen: verlängert die Lease beim Router (oder holt
+                # eine neue), statt die alte Adresse über ihr Ablaufdatum hinaus statisch zu halten.
+                # Ändert sich die Adresse dabei, bindet wifi_task den Webserver neu.
+                radio.start_dhcp()
+                if not reachable:
+                    # Lease passt nicht mehr (anderes Netz, Adresse vergeben)
+                    raise OSError("Lease veraltet")
+        else:
+            if self.static:
+                self._set_address(self.static)
+            else:
+                radio.start_dhcp()
+            radio.connect(self.ssid, self.password)
+
+    async def connect(self):
+        """Verbinden; jede Runde erst gezielt (falls bekannt), dann voll. Versucht es unbegrenzt.
+
+        Nach jeder gescheiterten Runde Fehler-Effekt, danach pulsiert das Schild rot, bis die
+        Verbindung steht; dann zeichnet led_task den aktuellen Stand neu.
+        """
+        global display_dirty
+        rounds = 0
+        while True:
+            rounds += 1
+            for fast in ((True, False) if self.cache else (False,)):
+                mode = "fast" if fast else "full"
+                log.info("WiFi verbinden: %s (%s, Runde %d)", self.ssid, "gezielt" if fast else "voll", rounds)
+                t0 = time.monotonic_ns()
+                try:
+                    self._attempt(fast)
+                except Exception as e:
+                    log.warn("WiFi-Fehler: %s", e)
+                    count("onair_wifi_failures_total", 'mode="%s"' % mode)
+                    self.failures += 1
+                    continue
+                ns = time.monotonic_ns() - t0
+                histogram("onair_wifi_connect_seconds", 'mode="%s"' % mode).observe_ns(ns)
+                self.connects[mode] += 1
+                outage = int((time.monotonic() - self.lost_at) * 1000) if self.lost_at else None
+                self.last = {"mode": mode, "ms": ns // 1000000, "outage_ms": outage}
+                self.lost_at = None
+                self._ping_fails = 0
+                log.info("WiFi verbunden (%s) in %d ms%s.", mode, ns // 1000000,
+                         ", Ausfall %d ms" % outage if outage is not None else "")
+                self._save()
+                if rounds > 1:
+                    display_dirty = True  # Fehler-Effekt endet dunkel, Standby ist noch rot
+                return
+            animator.play(slot_effect("error"))
+            animator.set_idle(_offline_idle)
+            delay = min(WIFI_BACKOFF_MAX, WIFI_BACKOFF_BASE * 2 ** (rounds - 1))
+            await asyncio.sleep(delay * random.uniform(1 - WIFI_BACKOFF_JITTER, 1 + WIFI_BACKOFF_JITTER))
+
+    def check(self, now):
+        """True, solange die Verbindung steht. Pingt das Gateway nur alle WIFI_PING_SEC."""
+        radio = wifi.radio
+        if not radio.connected or radio.ap_info is None:
+            log.warn("WLAN getrennt (Radio).")
+        elif now >= self._ping_at and (now - last_http_activity) > WEB_PRIORITY_QUIET_SEC:
+            self._ping_fails = 0 if self._gateway_reachable() else self._ping_fails + 1
+            self._ping_at = now + (WIFI_PING_RETRY_SEC if self._ping_fails else WIFI_PING_SEC)
+            if not self._ping_fails:
+                self._save()              # per DHCP erneuerte Lease merken (schreibt nur bei Änderung)
+            if self._ping_fails < WIFI_PING_FAILS:
+                return True
+            log.warn("WLAN weg (Gateway antwortet nicht).")
+        else:
             return True
-        except Exception as e:
-            print("WiFi-Fehler:", e)
-            error_effect()
-            time.sleep(retry_delay)
-    return False
+        self.lost_at = now
+        try:
+            radio.disconnect()
+        except Exception:
+            pass
+        return False
+
+    def status(self):
+        ap = wifi.radio.ap_info
+        return {"connected": wifi.radio.connected, "rssi": ap.rssi if ap else None,
+                "channel": ap.channel if ap else None, "cached": bool(self.cache),
+                "connects": self.connects, "failures": self.failures, "last": self.last}
+
+wifi_sup = WifiSupervisor(secrets["wifi"]["ssid"], secrets["wifi"]["password"],
+                          secrets["wifi"].get("static"))
+
+# =========================
+#   HTTPS-Verbindungen zu Twitch (Keep-Alive)
+# =========================
+_PEEK = bytearray(1)
+
+def _peer_closed(sock):
+    """True, wenn die Gegenseite die Verbindung geschlossen hat (oder unerwartet Daten liegen)."""
+    try:
+        sock.settimeout(0)
+        sock.recv_into(_PEEK, 1)  # 0 = EOF; Daten hier wären Reste einer alten Antwort
+        return True
+    except OSError as e:
+        return getattr(e, "errno", None) not in (errno.EAGAIN, errno.ETIMEDOUT)
+    finally:
+        try:
+            sock.settimeout(HTTP_TIMEOUT)
+        except OSError:
+            pass
+
+class TwitchConnections:
+    """Hält die TLS-Verbindungen zu id.twitch.tv/api.twitch.tv über die Zyklen offen.
+
+    Vor jeder Anfrage wird die wartende Verbindung geprüft: Hat Twitch sie im Leerlauf
+    geschlossen, wird sie sofort verworfen – sonst würde der Request erst in den Timeout
+    laufen. Misst außerdem die Zeit bis zur Antwort, getrennt nach neu/wiederverwendet.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._cm = session._connection_manager
+        self._last = None             # letzte Antwort; ihr Socket geht vor dem nächsten Request zurück
+        self._used = {}               # host -> monotonic der letzten Anfrage
+        self.stats = {}               # host -> Zähler + Zeiten
+
+    def _waiting_socket(self, host):
+        sid = self.session._session_id
+        key = (host, 443, "https:", str(sid) if sid else None)
+        sock = self._cm._managed_socket_by_key.get(key)
+        return sock if sock in self._cm._available_sockets else None
+
+    def request(self, method, url, **kwargs):
+        if self._last:
+            self._last.close()
+            self._last = None
+        host = url.split("/", 3)[2]
+        st = self.stats.get(host)
+        if st is None:
+            st = self.stats[host] = {"requests": 0, "reused": 0, "idle_closed": 0, "errors": 0,
+                                     "last_ms": None, "new_ms": 0, "reused_ms": 0}
+        now = time.monotonic()
+        sock = self._waiting_socket(host)
+        if sock is not None and (now - self._used.get(host, now) > KEEPALIVE_MAX_IDLE_SEC
+                                 or _peer_closed(sock)):
+            self._cm.close_socket(sock)
+            st["idle_closed"] += 1
+            sock = None
+        try:
+            r = self.session.request(method, url, **kwargs)
+        except Exception:
+            st["errors"] += 1
+            raise
+        ms = int((time.monotonic() - now) * 1000)
+        self._used[host] = time.monotonic()
+        self._last = r
+        st["requests"] += 1
+        st["last_ms"] = ms
+        if sock is not None:
+            st["reused"] += 1
+            st["reused_ms"] += ms
+        else:
+            st["new_ms"] += ms
+        return r
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def status(self):
+        out = {}
+        for host, st in self.stats.items():
+            new = st["requests"] - st["reused"]
+            out[host] = {"requests": st["requests"], "reused": st["reused"],
+                         "idle_closed": st["idle_closed"], "errors": st["errors"],
+                         "last_ms": st["last_ms"],
+                         "avg_new_ms": st["new_ms"] // new if new else None,
+                         "avg_reused_ms": st["reused_ms"] // st["reused"] if st["reused"] else None}
+        return out
+
+twitch_net = None              # TwitchConnections, wird in main() angelegt
 
 # =========================
 #   Twitch API / Token mit Backoff
@@ -142,9 +1029,41 @@ TWITCH_STREAMS_URL = "https://api.twitch.tv/helix/streams"
 _access_token = None
 _token_expiry_epoch = 0
 _token_retry_after = 0.0  # Backoff bei Token-Fehlern
+_clock_offset = 0         # Sekunden: Twitch-Uhr (Date-Header) minus time.time()
+_clock_synced = False     # Pico W hat keine gestellte Uhr, bis Twitch die Zeit liefert
+
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+def _http_date_epoch(value):
+    """'Sun, 18 Oct 2026 08:00:00 GMT' -> Unix-Zeit (ohne time.mktime, das am Pico lokal rechnet)."""
+    _, day, mon, year, hms, _ = value.split(" ")
+    y, m, d = int(year), _MONTHS.index(mon) + 1, int(day)
+    hh, mm, ss = (int(x) for x in hms.split(":"))
+    # Tage seit 1970-01-01 (Algorithmus "days from civil")
+    y -= m <= 2
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    days = era * 146097 + doe - 719468
+    return days * 86400 + hh * 3600 + mm * 60 + ss
+
+def _sync_clock(r):
+    """Uhr am Date-Header einer Twitch-Antwort ausrichten."""
+    global _clock_offset, _clock_synced
+    date = r.headers.get("date")
+    if not date:
+        return
+    try:
+        _clock_offset = _http_date_epoch(date) - int(time.time())
+    except (ValueError, IndexError):
+        return
+    if not _clock_synced:
+        _clock_synced = True
+        expire_restored_state()   # erst jetzt lässt sich das Alter von state.json prüfen
 
 def _now_epoch():
-    return time.time()
+    return time.time() + _clock_offset
 
 def _now_mono():
     return time.monotonic()
@@ -157,16 +1076,63 @@ def get_app_access_token(requests):
         "grant_type": "client_credentials",
     }
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    print("Hole neues Twitch App Access Token...")
+    count("onair_token_refresh_total")
+    log.info("Hole neues Twitch App Access Token...")
     resp = requests.post(TWITCH_OAUTH_URL, data=payload, headers=headers, timeout=HTTP_TIMEOUT)
+    _sync_clock(resp)
     if resp.status_code != 200:
         raise RuntimeError("OAuth fehlgeschlagen: " + str(resp.status_code) + " " + resp.text)
     data = resp.json()
     _access_token = data.get("access_token")
     expires_in = int(data.get("expires_in", 0))
     _token_expiry_epoch = _now_epoch() + max(0, expires_in - 60)  # 60s Puffer
-    print("Token OK; gültig ~", expires_in, "s (mit Puffer).")
+    log.info("Token OK; gültig ~ %d s (mit Puffer).", int(expires_in))
+    _save_token_cache()
+
+def _token_checksum(token, expiry):
+    # client_id gehört dazu: neue Zugangsdaten in secrets.json entwerten den Cache
+    text = "%s|%d|%s" % (token, expiry, secrets["twitch"]["client_id"])
+    return binascii.crc32(text.encode("utf-8")) & 0xFFFFFFFF
+
+def _save_token_cache():
+    # Nur mit gestellter Uhr ist das Ablaufdatum absolut und nach einem Neustart noch gültig
+    if not _clock_synced:
+        return
+    expiry = int(_token_expiry_epoch)
+    save_json(TOKEN_CACHE_FILE, {"token": _access_token, "expires": expiry,
+                                 "crc": _token_checksum(_access_token, expiry)})
+
+def _drop_token_cache():
+    try:
+        os.remove(TOKEN_CACHE_FILE)
+    except OSError:
+        pass
+
+def load_token_cache():
+    """Token vom letzten Lauf übernehmen; spart den OAuth-Roundtrip beim Start.
+
+    Das Ablaufdatum lässt sich erst prüfen, wenn die Uhr gestellt ist. Bis dahin wird das
+    Token einfach probiert – ist es doch ungültig, holt der 401-Pfad ein neues.
+    """
+    global _access_token, _token_expiry_epoch
+    try:
+        data = load_json(TOKEN_CACHE_FILE)
+        token, expiry = data["token"], int(data["expires"])
+        if data.get("crc") != _token_checksum(token, expiry):
+            raise ValueError("Prüfsumme falsch")
+    except OSError:
+        return False
+    except Exception as e:
+        log.warn("Token-Cache verworfen: %s", e)
+        _drop_token_cache()
+        return False
+    if _clock_synced and _now_epoch() >= expiry:
+        return False
+    _access_token, _token_expiry_epoch = token, expiry
+    log.info("Token aus Cache übernommen.")
+    return True
 
+@timed("onair_token_seconds")
 def ensure_token(requests):
     global _token_retry_after
     if (_access_token is not None) and (_now_epoch() < _token_expiry_epoch):
@@ -177,248 +1143,1370 @@ def ensure_token(requests):
         get_app_access_token(requests)
         return _access_token
     except Exception as e:
-        print("Token holen fehlgeschlagen:", e)
-        _token_retry_after = _now_mono() + 30.0  # 30 s pausieren
+        log.error("Token holen fehlgeschlagen: %s", e)
+        # 30 s pausieren – oder länger, falls Twitch uns gerade drosselt
+        _token_retry_after = _now_mono() + max(30.0, rate_governor.wait_time(_now_mono()))
         return None
 
-def is_channel_online(channel_name, requests, server=None, token_cached=None):
+def token_blocked():
+    """True, solange ensure_token() wegen des Backoffs ohnehin None liefert."""
+    valid = (_access_token is not None) and (_now_epoch() < _token_expiry_epoch)
+    return (not valid) and _now_mono() < _token_retry_after
+
+HELIX_MAX_LOGINS = 100        # Helix erlaubt max. 100 user_login-Parameter pro Anfrage
+
+def _invalidate_token():
+    global _access_token, _token_expiry_epoch
+    _access_token = None
+    _token_expiry_epoch = 0
+    _drop_token_cache()
+
+class RateGovernor:
+    """Helix-Punktekonto aus den Ratelimit-*-Headern; verteilt Anfragen vorab statt 429 zu kassieren."""
+
+    def __init__(self):
+        self.limit = None             # Ratelimit-Limit (Punkte pro Fenster)
+        self.remaining = None         # Ratelimit-Remaining der letzten Antwort
+        self._refill_at = 0.0         # monotonic: Bucket wieder voll
+        self._next_at = 0.0           # monotonic: frühester Zeitpunkt der nächsten Anfrage
+        self.throttled = 0            # 429 bekommen
+        self.deferred = 0             # Anfragen verschoben statt gesendet
+
+    def observe(self, r):
+        """Header einer Helix-Antwort übernehmen (auch bei 4xx)."""
+        _sync_clock(r)
+        h = r.headers
+        try:
+            limit = int(h.get("ratelimit-limit"))
+            remaining = int(h.get("ratelimit-remaining"))
+            reset = int(h.get("ratelimit-reset"))
+        except (TypeError, ValueError):
+            return
+        now = _now_mono()
+        # Reset ist eine Unix-Zeit; ohne gestellte Uhr (kein RTC) auf ein Fenster begrenzen
+        delay = reset - _now_epoch()
+        if not 0 <= delay <= RATELIMIT_WINDOW_SEC:
+            delay = RATELIMIT_WINDOW_SEC
+        self.limit, self.remaining = limit, remaining
+        self._refill_at = now + delay
+        if r.status_code == 429:
+            self.throttled += 1
+            self.remaining = 0
+            self._next_at = self._refill_at
+            log.warn("Rate limit (429) → Anfragen bis Reset in %d s verschoben.", int(delay))
+            return
+        # Restpunkte gleichmäßig bis zum Reset verteilen
+        spare = remaining - RATELIMIT_RESERVE
+        if spare <= 0:
+            self._next_at = self._refill_at
+        else:
+            self._next_at = now + delay / spare
+
+    def wait_time(self, now):
+        """Sekunden, bis die nächste Anfrage ohne 429 möglich ist (0 = sofort)."""
+        if now >= self._refill_at and self.remaining is not None:
+            self.remaining = self.limit
+        return max(0.0, self._next_at - now)
+
+    def defer(self):
+        self.deferred += 1
+
+    def status(self):
+        now = _now_mono()
+        return {"limit": self.limit, "remaining": self.remaining,
+                "wait": round(self.wait_time(now), 1),
+                "throttled": self.throttled, "deferred": self.deferred}
+
+rate_governor = RateGovernor()
+
+# =========================
+#   Helix-Antwort streamend lesen (statt r.json())
+# =========================
+# r.json() baut die ganze Antwort (Titel, Tags, Thumbnails ...) als Objekte im Heap auf.
+# Gebraucht wird nur data[*].user_login: der Scanner liest den Body durch einen festen
+# Puffer und merkt sich nur diese Strings. Nach dem Ende von "data" wird nur noch
+# weggelesen (nicht geparst), damit der Keep-Alive-Socket wiederverwendbar bleibt.
+HELIX_SCAN_BUF = 256          # Bytes je Lesevorgang
+_KEY_MAX = 32                 # längere Keys/Logins werden nicht aufgezeichnet
+_KEY_DATA = 1
+_KEY_LOGIN = 2
+
+class HelixScanner:
+    """Inkrementeller JSON-Scanner für /helix/streams: sammelt data[*].user_login."""
+
+    def __init__(self):
+        self.logins = set()
+        self.entries = 0              # Elemente in "data"
+        self.done = False             # "data" ist zu Ende -> Rest egal
+        self._stack = bytearray()     # "{" / "[" je Ebene
+        self._in_data = False
+        self._expect_key = False
+        self._key = 0
+        self._in_str = False
+        self._escape = False          # Backslash am Ende des letzten Häppchens
+        self._capture = None          # None, "key" oder "login"
+        self._cap = bytearray(_KEY_MAX)
+        self._cap_n = 0
+
+    def _take(self, buf, a, b):
+        if self._capture is None or a >= b:
+            return
+        m = min(b - a, _KEY_MAX - self._cap_n)
+        if m > 0:
+            self._cap[self._cap_n:self._cap_n + m] = buf[a:a + m]
+        self._cap_n += b - a
+
+    def _start_string(self):
+        self._in_str = True
+        self._cap_n = 0
+        if self._expect_key:
+            self._capture = "key"
+        elif self._in_data and self._key == _KEY_LOGIN and len(self._stack) == 3:
+            self._capture = "login"
+        else:
+            self._capture = None
+
+    def _end_string(self):
+        self._in_str = False
+        n = self._cap_n
+        if self._capture == "key":
+            self._key = 0
+            if n == 4 and self._cap[:4] == b"data":
+                self._key = _KEY_DATA
+            elif n == 10 and self._cap[:10] == b"user_login":
+                self._key = _KEY_LOGIN
+        elif self._capture == "login" and n <= _KEY_MAX:
+            self.logins.add(str(self._cap[:n], "utf-8").lower())
+        self._capture = None
+
+    def feed(self, buf, n):
+        """n Bytes aus buf verarbeiten (Häppchengrenzen dürfen mitten in Strings liegen)."""
+        i = 0
+        if self._escape and n:
+            self._escape = False
+            i = 1
+        stack = self._stack
+        while i < n and not self.done:
+            if self._in_str:
+                # Strings (Titel, URLs ...) in einem Rutsch überspringen
+                j = buf.find(b'"', i, n)
+                e = buf.find(b"\\", i, n if j < 0 else j)
+                if e >= 0:
+                    self._take(buf, i, e)
+                    if e + 1 < n:
+                        i = e + 2
+                    else:
+                        self._escape = True
+                        i = n
+                    continue
+                if j < 0:
+                    self._take(buf, i, n)
+                    break
+                self._take(buf, i, j)
+                self._end_string()
+                i = j + 1
+                continue
+            c = buf[i]
+            i += 1
+            if c == 0x22:                     # "
+                self._start_string()
+            elif c == 0x3A:                   # :
+                self._expect_key = False
+            elif c == 0x2C:                   # ,
+                self._expect_key = bool(stack) and stack[-1] == 0x7B
+            elif c == 0x7B:                   # {
+                if self._in_data and len(stack) == 2:
+                    self.entries += 1
+                stack.append(c)
+                self._expect_key = True
+            elif c == 0x5B:                   # [
+                if len(stack) == 1 and self._key == _KEY_DATA:
+                    self._in_data = True
+                stack.append(c)
+                self._expect_key = False
+            elif c == 0x7D or c == 0x5D:      # } ]
+                if stack:
+                    stack.pop()
+                self._expect_key = False
+                if self._in_data and len(stack) == 1:
+                    self.done = True
+
+_scan_buf = bytearray(HELIX_SCAN_BUF)
+
+@timed("onair_helix_parse_seconds")
+def scan_live_logins(r):
+    """Body einer /helix/streams-Antwort -> Menge der Live-Logins, ohne r.json()."""
+    scanner = HelixScanner()
+    read = r._readinto                # fester Puffer; iter_content() würde je Häppchen bytes anlegen
+    while True:
+        n = read(_scan_buf)
+        if n == 0:
+            break
+        if not scanner.done:
+            scanner.feed(_scan_buf, n)
+    r.close()
+    if not scanner.done:
+        raise ValueError("Helix-Antwort unvollständig")
+    return scanner.logins
+
+def _fetch_live_chunk(logins, requests, server=None, token_cached=None):
+    """Eine Helix-Anfrage für bis zu HELIX_MAX_LOGINS Logins -> Menge der Live-Logins.
+
+    None heißt: kein Ergebnis (gedrosselt/Fehler) – der bisherige Zustand bleibt stehen.
+    """
     def _call(retried=False):
-        token = token_cached if token_cached else ensure_token(requests)
+        token = token_cached if (token_cached and not retried) else ensure_token(requests)
         if not token:
-            return True, False
+            return None
+        if rate_governor.wait_time(_now_mono()) > 0:
+            rate_governor.defer()
+            return None
 
         headers = {
             "Client-ID": secrets["twitch"]["client_id"],
             "Authorization": "Bearer " + token,
         }
-        url = f"{TWITCH_STREAMS_URL}?user_login={channel_name}"
+        url = TWITCH_STREAMS_URL + "?" + "&".join("user_login=" + n for n in logins)
 
         if server:
             try:
                 server.poll()
             except Exception as e:
-                print("Server poll vor Request:", e)
+                log.warn("Server poll vor Request: %s", e)
 
         r = requests.get(url, headers=headers, timeout=HTTP_TIMEOUT)
+        rate_governor.observe(r)
         if r.status_code == 200:
-            d = r.json()
-            return True, ("data" in d and len(d["data"]) > 0)
+            return scan_live_logins(r)
+        if r.status_code in (401, 429):
+            count("onair_twitch_responses_total", 'code="%d"' % r.status_code)
         if r.status_code == 401 and not retried:
-            print("401 → Token erneuern…")
+            r.content
+            log.warn("401 → Token erneuern…")
+            _invalidate_token()
             return _call(retried=True)
-        if r.status_code == 429:
-            print("Rate limit (429).")
-            return True, False
-        print("Twitch HTTP", r.status_code)
-        return True, False
+        r.content                     # Antwort ganz lesen -> Socket bleibt wiederverwendbar
+        if r.status_code != 429:
+            log.warn("Twitch HTTP %d", r.status_code)
+        return None
 
     try:
-        ok, res = _call()
-        return res if ok else False
+        return _call()
     except OSError as e:
         if getattr(e, "errno", None) in (errno.ECONNABORTED, errno.ETIMEDOUT, errno.EINPROGRESS):
-            print(f"Twitch-Fehler {channel_name}: {e} → offline weiter.")
-            return False
-        print(f"Twitch-Fehler unerwartet {channel_name}: {e}")
-        return False
+            count("onair_twitch_errors_total", 'kind="timeout"')
+            log.warn("Twitch-Fehler %s: %s → letzter Zustand bleibt.", ",".join(logins), e)
+            return None
+        count("onair_twitch_errors_total", 'kind="oserror"')
+        log.error("Twitch-Fehler unerwartet %s: %s", ",".join(logins), e)
+        return None
     except Exception as e:
-        print(f"Twitch-Fehler {channel_name}: {e}")
-        return False
+        count("onair_twitch_errors_total", 'kind="other"')
+        log.error("Twitch-Fehler %s: %s", ",".join(logins), e)
+        return None
+
+@timed("onair_twitch_check_seconds")
+def fetch_live_channels(names, requests, server=None, token_cached=None):
+    """Prüft alle Kanäle gebündelt (ein Request je HELIX_MAX_LOGINS) -> {login: live}.
+
+    Kanäle ohne Ergebnis (gedrosselt/Fehler) fehlen im Ergebnis, damit nichts fälschlich offline wird.
+    """
+    logins = []
+    for n in names:
+        n = n.strip().lower()
+        if n and n not in logins:
+            logins.append(n)
+
+    live = {}
+    for i in range(0, len(logins), HELIX_MAX_LOGINS):
+        chunk = logins[i:i + HELIX_MAX_LOGINS]
+        online = _fetch_live_chunk(chunk, requests, server=server, token_cached=token_cached)
+        if online is None:
+            continue
+        for n in chunk:
+            live[n] = n in online
+        # Zwischen den Teilanfragen Server kurz bedienen
+        if server and i + HELIX_MAX_LOGINS < len(logins):
+            try:
+                server.poll()
+            except Exception as e:
+                log.warn("Server poll innerhalb Twitch-Abfrage: %s", e)
+    return live
+
+def pick_online_channel(channels, live):
+    """Erster Live-Kanal in Konfigurations-Reihenfolge (= Priorität) oder None."""
+    for ch in channels:
+        if live.get(ch["name"].strip().lower()):
+            return ch
+    return None
+
+live_state = {}               # login -> live; aus Polling UND EventSub
+
+class StatusCache:
+    """Letztes Ergebnis je Kanal mit Zeitpunkt und TTL für GET /status (nie ausgehende Anfragen).
+
+    Der JSON-Text wird nur nach einer Änderung neu gebaut; die ETag-Version zählt mit.
+    """
+
+    def __init__(self):
+        self.entries = {}             # login -> (checked_at_epoch|None, quelle)
+        self.version = 0
+        self._boot = random.randint(0, 65535)  # ETag nach Neustart nie wiederverwenden
+        self._body = None
+
+    def record(self, logins, source):
+        stamp = int(_now_epoch()) if _clock_synced else None
+        for n in logins:
+            self.entries[n] = (stamp, source)
+        self.version += 1
+        self._body = None
+
+    def etag(self):
+        return '"s%x-%d"' % (self._boot, self.version)
+
+    def _ttl(self, login, source):
+        if source == "fleet":
+            return FLEET_TIMEOUT_SEC
+        if source == "push":
+            return EVENTSUB_RECONCILE_SEC
+        return poll_scheduler.interval(login)
+
+    def body(self):
+        if self._body is None:
+            channels = {}
+            for ch in config.get("channels", []):
+                n = ch["name"].strip().lower()
+                checked_at, source = self.entries.get(n, (None, None))
+                channels[n] = {"live": bool(live_state.get(n)), "checked_at": checked_at,
+                               "ttl": self._ttl(n, source), "source": source}
+            self._body = json.dumps({"channel": _login(last_online_channel),
+                                     "clock_synced": _clock_synced, "channels": channels})
+        return self._body
+
+status_cache = StatusCache()
+
+def update_live_state(changes, source="poll"):
+    """Live-Status übernehmen und den Kanal mit der höchsten Priorität anzeigen lassen."""
+    global last_online_channel, display_dirty, state_dirty
+    delta = {n: v for n, v in changes.items() if live_state.get(n) != v}
+    live_state.update(changes)
+    status_cache.record(changes, source)   # auch ohne Änderungen: Kanalliste/Priorität neu
+    current = pick_online_channel(config.get("channels", []), live_state)
+    if current is not last_online_channel:
+        display_dirty = True
+        state_dirty = True
+    if delta or current is not last_online_channel:
+        event_hub.live(delta, current)
+        if fleet:
+            fleet.dirty = True
+    last_online_channel = current
+
+_restored_seen = None         # "seen" aus state.json, bis die Uhr gestellt ist
+
+def restore_state():
+    """Zuletzt angezeigten Kanal aus state.json übernehmen (vor WLAN und erster Abfrage).
+
+    Die erste echte Abfrage korrigiert den Stand nach wenigen Sekunden, falls er veraltet ist.
+    Das Alter lässt sich erst mit gestellter Uhr prüfen (siehe expire_restored_state).
+    """
+    global last_online_channel, _restored_seen
+    try:
+        data = load_json(STATE_FILE)
+        login = data.get("live")
+    except Exception:
+        return None
+    ch = pick_online_channel(config.get("channels", []), {login: True}) if login else None
+    if ch:
+        live_state[login] = True
+        last_online_channel = ch
+        _restored_seen = data.get("seen")
+    return ch
+
+def expire_restored_state():
+    """Beim ersten Stellen der Uhr: wiederhergestellten, noch unbestätigten Kanal verwerfen,
+    wenn state.json älter als STATE_MAX_AGE_SEC ist (sonst bliebe er live, bis eine Abfrage gelingt).
+    """
+    global _restored_seen
+    seen, _restored_seen = _restored_seen, None
+    login = _login(last_online_channel)
+    # status_cache kennt jeden echten Stand (Abfrage, Push, Flotte) -> dann ist nichts mehr zu tun
+    if seen is None or login is None or login in status_cache.entries:
+        return
+    age = int(_now_epoch()) - seen
+    if age > STATE_MAX_AGE_SEC:
+        log.info("state.json ist %d min alt -> %s nicht mehr live anzeigen.", age // 60, login)
+        live_state.pop(login, None)
+        update_live_state({})
+
+def save_state():
+    global state_dirty, state_saved_at
+    state_dirty = False
+    state_saved_at = time.monotonic()
+    login = _login(last_online_channel)
+    # "seen": wann der Kanal zuletzt wirklich als live bestätigt wurde (None ohne gestellte Uhr)
+    seen = status_cache.entries.get(login, (None, None))[0] if login else None
+    save_json(STATE_FILE, {"live": login, "seen": seen})
+
+@timed("onair_twitch_check_seconds", 'channel="single"')
+def is_channel_online(channel_name, requests, server=None, token_cached=None):
+    live = fetch_live_channels([channel_name], requests, server=server, token_cached=token_cached)
+    return live.get(channel_name.strip().lower(), False)
 
 # =========================
-#   Web UI (HTML) – Dark Mode mit Persistenz
+#   Adaptiver Poll-Plan pro Kanal
 # =========================
-HTML_PAGE = """
-<!doctype html>
-<html>
-<head>
-<meta charset="utf-8">
-<meta name="viewport" content="width=device-width,initial-scale=1">
-<title>ONAIR LED – Konfiguration</title>
-<style>
-:root{
-  --bg:#ffffff; --fg:#111111; --card:#f7f7f7; --border:#dddddd; --badge:#eeeeee;
-  --primary:#4a67ff; --danger:#d33; --muted:#666666;
-}
-body[data-theme="dark"]{
-  --bg:#0b0f14; --fg:#e6eaf0; --card:#111827; --border:#213244; --badge:#1b2836;
-  --primary:#7aa2ff; --danger:#ff6b6b; --muted:#9aa7b3;
-}
-html,body{height:100%}
-body{background:var(--bg);color:var(--fg);font-family:system-ui,Segoe UI,Arial,sans-serif;max-width:980px;margin:0 auto;padding:16px}
-h1{font-size:1.4rem;margin:0 0 12px}
-.card{background:var(--card);border:1px solid var(--border);border-radius:12px;padding:12px;margin:12px 0}
-.row{display:flex;gap:12px;flex-wrap:wrap}
-.col{flex:1 1 220px}
-label{display:block;font-size:.9rem;margin:.4rem 0 .2rem}
-input[type="text"]{width:100%;padding:8px;border-radius:8px;border:1px solid var(--border);background:transparent;color:var(--fg)}
-input[type="color"]{width:52px;height:36px;border:none;background:none;padding:0}
-input[type="range"]{width:140px}
-button{padding:8px 14px;border:0;border-radius:10px;cursor:pointer}
-button.primary{background:var(--primary);color:white}
-button.danger{background:var(--danger);color:white}
-.badge{display:inline-block;padding:2px 8px;border-radius:999px;background:var(--badge);margin-left:6px}
-.grid{display:grid;grid-template-columns:repeat(5,minmax(160px,1fr));gap:8px}
-.small{font-size:.85rem;color:var(--muted)}
-hr{border:0;border-top:1px solid var(--border);margin:14px 0}
-.switch{position:relative;display:inline-block;width:54px;height:28px;vertical-align:middle}
-.switch input{opacity:0;width:0;height:0}
-.slider{position:absolute;cursor:pointer;top:0;left:0;right:0;bottom:0;background:#bbb;transition:.2s;border-radius:999px}
-.slider:before{position:absolute;content:"";height:22px;width:22px;left:3px;bottom:3px;background:white;transition:.2s;border-radius:50%}
-input:checked + .slider{background:var(--primary)}
-input:checked + .slider:before{transform:translateX(26px)}
-.notice{margin-left:8px}
-</style>
-</head>
-<body data-theme="light">
-<h1>
-  ONAIR LED – Konfiguration
-  <span id="status" class="badge">geladen</span>
-  <span class="badge notice">Theme</span>
-  <label class="switch" title="Dark Mode">
-    <input id="themeToggle" type="checkbox" onchange="toggleTheme()">
-    <span class="slider"></span>
-  </label>
-</h1>
-
-<div class="card">
-  <h3>Streamer</h3>
-  <div id="channels"></div>
-  <hr>
-  <div class="row">
-    <div class="col">
-      <h4>Neuen Streamer hinzufügen</h4>
-      <label>Login-Name</label>
-      <input id="newname" type="text" placeholder="twitch_username">
-      <div class="small">Standardfarben werden gesetzt; danach anpassen.</div>
-      <div style="margin-top:8px">
-        <button class="primary" onclick="addChannel()">Hinzufügen</button>
-      </div>
-    </div>
-    <div class="col">
-      <h4>Offline-Farbe</h4>
-      <div class="row">
-        <input id="offlineColor" type="color">
-        <button onclick="saveOfflineColor()">Speichern</button>
-      </div>
-      <div class="small">Wirkt im Standby-Puls.</div>
-    </div>
-  </div>
-</div>
-
-<script>
-const letters = ["O","N","A","I","R"];
-let cfg = null;
-
-function rgbToHex(rgb){const [r,g,b]=rgb;return "#"+[r,g,b].map(v=>v.toString(16).padStart(2,"0")).join("").toUpperCase();}
-function hexToRgb(h){return [parseInt(h.slice(1,3),16),parseInt(h.slice(3,5),16),parseInt(h.slice(5,7),16)];}
-
-function applyTheme(theme){
-  document.body.setAttribute("data-theme", theme === "dark" ? "dark" : "light");
-  document.getElementById("themeToggle").checked = (theme === "dark");
-}
+class PollScheduler:
+    """Fälligkeit je Kanal aus Zustand + Priorität, mit Jitter und globalem Anfrage-Budget."""
+
+    def __init__(self):
+        self._due = {}                # login -> monotonic, wann wieder prüfen
+        self._last = {}               # login -> monotonic, zuletzt geprüft
+        self._interval = {}           # login -> zuletzt vergebenes Intervall
+        self._budget = POLL_BUDGET_PER_MIN
+        self._budget_at = time.monotonic()
+        self.forced = 0               # Abfragen trotz laufender Webrequests (Höchstwartezeit erreicht)
+
+    def interval_for(self, idx, login, shown_idx, pushed):
+        """Intervall für den Kanal an Position idx, wenn Kanal shown_idx angezeigt wird (oder None)."""
+        if login in pushed:
+            return EVENTSUB_RECONCILE_SEC
+        if shown_idx is None:
+            return POLL_BASE_SEC + idx * POLL_PRIORITY_STEP_SEC
+        if idx == shown_idx:
+            return POLL_LIVE_SEC
+        if idx < shown_idx:
+            return POLL_PREEMPT_SEC
+        return POLL_LOW_SEC
+
+    def due(self, logins, now):
+        """Fällige Logins (plus die, die ohnehin bald dran wären), in Prioritäts-Reihenfolge."""
+        if not any(self._due.get(n, 0) <= now for n in logins):
+            return []
+        return [n for n in logins if self._due.get(n, 0) <= now + POLL_COALESCE_SEC]
+
+    def take_budget(self, now):
+        """Eine Anfrage aus dem Minuten-Budget nehmen (Token-Bucket). False = später."""
+        self._budget = min(POLL_BUDGET_PER_MIN,
+                           self._budget + (now - self._budget_at) * POLL_BUDGET_PER_MIN / 60)
+        self._budget_at = now
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
 
-async function loadConfig(){
-  const r = await fetch("/config"); // wird direkt bedient (keine Twitch-Abhängigkeit)
-  cfg = await r.json();
-  applyTheme((cfg.ui && cfg.ui.theme) ? cfg.ui.theme : "light");
-  renderChannels();
-  document.getElementById("offlineColor").value = rgbToHex(cfg.offline_color || [50,50,50]);
-}
+    def done(self, checked, logins, now, shown_login, pushed):
+        """Nach einer Abfrage neue Fälligkeiten für alle Kanäle berechnen."""
+        shown_idx = logins.index(shown_login) if shown_login in logins else None
+        for idx, login in enumerate(logins):
+            interval = self.interval_for(idx, login, shown_idx, pushed)
+            self._interval[login] = interval
+            if login in checked:
+                self._last[login] = now
+                base = now
+            else:
+                # Zustand geändert -> Fälligkeit an das neue Intervall anpassen
+                base = self._last.get(login, now)
+            jitter = 1 + random.uniform(-POLL_JITTER, POLL_JITTER)
+            due = base + interval * jitter
+            if login in checked or (login in self._due and due < self._due[login]):
+                self._due[login] = due
+        for login in list(self._due):
+            if login not in logins:
+                del self._due[login]
+                self._last.pop(login, None)
+                self._interval.pop(login, None)
+
+    def interval(self, login):
+        """Zuletzt vergebenes Intervall des Kanals in Sekunden (oder None)."""
+        return self._interval.get(login)
+
+    def checked_ago(self, now):
+        """login -> Sekunden seit der letzten Prüfung, für alle schon geprüften Kanäle."""
+        return {n: round(now - t, 1) for n, t in self._last.items()}
+
+    def snapshot(self, logins, now):
+        return {
+            "budget": int(self._budget),
+            "budget_per_min": POLL_BUDGET_PER_MIN,
+            "max_defer": TWITCH_MAX_DEFER_SEC,
+            "forced": self.forced,
+            "channels": [{
+                "name": n,
+                "interval": self._interval.get(n),
+                "next_in": round(max(0, self._due.get(n, now) - now), 1),
+                "checked_ago": round(now - self._last[n], 1) if n in self._last else None,
+                "live": live_state.get(n, False),
+            } for n in logins],
+        }
 
-function renderChannels(){
-  const wrap = document.getElementById("channels");
-  wrap.innerHTML = "";
-  cfg.channels.forEach((ch, idx) => {
-    const div = document.createElement("div");
-    div.className = "card";
-    div.innerHTML = `
-      <div class="row" style="align-items:center;justify-content:space-between">
-        <h4 style="margin:4px 0">${idx+1}. ${ch.name}</h4>
-        <div>
-          <button class="danger" onclick="delChannel('${ch.name}')">Löschen</button>
-          <button class="primary" onclick="saveChannel('${ch.name}')">Speichern</button>
-        </div>
-      </div>
-      <div class="grid">
-        ${letters.map(L => {
-          const data = (ch.letters && ch.letters[L]) ? ch.letters[L] : {color:[0,0,0],brightness:0.5};
-          const hex = rgbToHex(data.color);
-          const br = data.brightness ?? 0.5;
-          return `
-            <div>
-              <label><strong>${L}</strong> Farbe</label>
-              <input id="${ch.name}_${L}_color" type="color" value="${hex}">
-              <label>Helligkeit</label>
-              <input id="${ch.name}_${L}_bri" type="range" min="0" max="1" step="0.05" value="${br}">
-              <span id="${ch.name}_${L}_bri_val" class="small">${br}</span>
-            </div>
-          `;
-        }).join("")}
-      </div>
-    `;
-    wrap.appendChild(div);
-    letters.forEach(L => {
-      const el = document.getElementById(`${ch.name}_${L}_bri`);
-      const lab = document.getElementById(`${ch.name}_${L}_bri_val`);
-      el.addEventListener("input",()=>lab.textContent = el.value);
-    });
-  });
-}
+poll_scheduler = PollScheduler()
 
-async function toggleTheme(){
-  const enabled = document.getElementById("themeToggle").checked;
-  const theme = enabled ? "dark" : "light";
-  applyTheme(theme);
-  const r = await fetch("/set_ui_theme", {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({theme})});
-  const js = await r.json();
-  if(!js.ok){ alert("Speichern fehlgeschlagen (evtl. Dateisystem read-only)."); }
-}
+# =========================
+#   Twitch EventSub (Push-Modus über WebSocket)
+# =========================
+# Optional: mit einem User-Access-Token (secrets.json: twitch.access_token, siehe
+# README Schritt 3) meldet Twitch stream.online/stream.offline sofort. Das Polling
+# läuft dann nur noch alle EVENTSUB_RECONCILE_SEC Sekunden zum Abgleich.
+EVENTSUB_URL = "wss://eventsub.wss.twitch.tv/ws?keepalive_timeout_seconds=30"
+TWITCH_USERS_URL = "https://api.twitch.tv/helix/users"
+TWITCH_SUBSCRIPTIONS_URL = "https://api.twitch.tv/helix/eventsub/subscriptions"
+EVENTSUB_RECONCILE_SEC = 300  # Abgleich per Polling, solange Push aktiv ist
+EVENTSUB_BACKOFF_MAX = 120    # max. Wartezeit zwischen Verbindungsversuchen
+EVENTSUB_MAX_MESSAGE = 8192   # größere Nachrichten -> Verbindung neu aufbauen
+EVENTSUB_SUBSCRIBE_WINDOW = 8 # Twitch trennt, wenn nach dem Welcome 10 s nichts abonniert ist
+
+class WebSocketClient:
+    """Minimaler WebSocket-Client (RFC 6455) über socketpool + ssl; nicht-blockierendes poll()."""
+
+    def __init__(self, pool, ssl_context):
+        self._pool = pool
+        self._ssl = ssl_context
+        self._sock = None
+        self._rx = bytearray()
+        self._frag = None
+        self._chunk = bytearray(512)
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def connect(self, url, timeout=HTTP_TIMEOUT * 2):
+        rest = url.split("://", 1)[1]
+        host, _, path = rest.partition("/")
+        path = "/" + path
+        sock = self._pool.socket(self._pool.AF_INET, self._pool.SOCK_STREAM)
+        sock = self._ssl.wrap_socket(sock, server_hostname=host)
+        sock.settimeout(timeout)
+        try:
+            sock.connect((host, 443))
+            key = binascii.b2a_base64(os.urandom(16)).strip().decode()
+            self._send_all(sock, (
+                "GET %s HTTP/1.1\r\nHost: %s\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                "Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n\r\n" % (path, host, key)
+            ).encode())
+            head = bytearray()
+            while b"\r\n\r\n" not in head:
+                n = sock.recv_into(self._chunk)
+                if not n:
+                    raise OSError(errno.ECONNABORTED, "handshake")
+                head.extend(memoryview(self._chunk)[:n])
+                if len(head) > 2048:
+                    raise OSError(errno.EIO, "handshake too long")
+            end = head.find(b"\r\n\r\n") + 4
+            if not head.startswith(b"HTTP/1.1 101"):
+                raise OSError(errno.ECONNREFUSED, bytes(head[:32]).decode())
+            self._rx = bytearray(head[end:])
+            sock.settimeout(0)
+        except Exception:
+            sock.close()
+            raise
+        self._sock = sock
+        self._frag = None
 
-async function saveChannel(name){
-  const payload = { name, letters:{} };
-  letters.forEach(L => {
-    const hex = document.getElementById(`${name}_${L}_color`).value;
-    const bri = parseFloat(document.getElementById(`${name}_${L}_bri`).value);
-    payload.letters[L] = { color: hexToRgb(hex), brightness: bri };
-  });
-  const r = await fetch("/save_channel", {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify(payload)});
-  const js = await r.json();
-  if(!js.ok){ alert("Speichern fehlgeschlagen (evtl. Dateisystem read-only)."); }
-  await loadConfig();
-}
+    def close(self):
+        if self._sock:
+            try:
+                self._send_frame(0x8, b"")
+            except Exception:
+                pass
+            try:
+                self._sock.close()
+            except Exception:
+                pass
+        self._sock = None
+        self._rx = bytearray()
+
+    @staticmethod
+    def _send_all(sock, data):
+        view = memoryview(data)
+        sent = 0
+        while sent < len(data):
+            try:
+                sent += sock.send(view[sent:])
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def _send_frame(self, opcode, payload):
+        # Client->Server-Frames müssen maskiert sein
+        mask = os.urandom(4)
+        n = len(payload)
+        if n < 126:
+            head = bytes((0x80 | opcode, 0x80 | n))
+        else:
+            head = bytes((0x80 | opcode, 0x80 | 126, n >> 8, n & 0xFF))
+        body = bytearray(payload)
+        for i in range(n):
+            body[i] ^= mask[i & 3]
+        self._send_all(self._sock, head + mask + body)
+
+    def poll(self):
+        """Verfügbare Bytes lesen; liefert eine Liste vollständiger Text-Nachrichten."""
+        if not self._sock:
+            return []
+        while True:
+            try:
+                n = self._sock.recv_into(self._chunk)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.ETIMEDOUT):
+                    break
+                raise
+            if not n:
+                self.close()
+                raise OSError(errno.ECONNRESET, "closed by peer")
+            self._rx.extend(memoryview(self._chunk)[:n])
+            if len(self._rx) > EVENTSUB_MAX_MESSAGE + 14:
+                raise OSError(errno.EMSGSIZE, "message too large")
+        messages = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return messages
+            fin, opcode, payload = frame
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+            elif opcode == 0x8:
+                self.close()
+                raise OSError(errno.ECONNRESET, "close frame")
+            elif opcode in (0x1, 0x0):
+                self._frag = payload if opcode == 0x1 else (self._frag or b"") + payload
+                if fin:
+                    messages.append(bytes(self._frag).decode("utf-8"))
+                    self._frag = None
+
+    def _next_frame(self):
+        rx = self._rx
+        if len(rx) < 2:
+            return None
+        ln = rx[1] & 0x7F
+        pos = 2
+        if ln == 126:
+            if len(rx) < 4:
+                return None
+            ln = (rx[2] << 8) | rx[3]
+            pos = 4
+        elif ln == 127:
+            if len(rx) < 10:
+                return None
+            ln = 0
+            for i in range(2, 10):
+                ln = (ln << 8) | rx[i]
+            pos = 10
+        if len(rx) < pos + ln:
+            return None
+        payload = bytes(rx[pos:pos + ln])
+        self._rx = rx[pos + ln:]
+        return (rx[0] & 0x80, rx[0] & 0x0F, payload)
+
+class EventSub:
+    """Sitzung, Abos und Keepalive-Überwachung für den Push-Modus."""
+
+    def __init__(self, pool, ssl_context):
+        self.ws = WebSocketClient(pool, ssl_context)
+        self.session_id = None
+        self.healthy = False          # Welcome + mind. ein Abo ok -> Polling nur noch zum Abgleich
+        self.subscribed = set()       # Logins mit aktiven Abos
+        self.resubscribe = False      # Kanalliste geändert -> neue Sitzung
+        self.disabled = None          # Grund, falls der Push-Modus aufgegeben wurde
+        self._keepalive = 30
+        self._last_rx = 0.0
+        self._backoff = 5
+
+    @staticmethod
+    def available():
+        return bool(secrets["twitch"].get("access_token"))
+
+    def status(self):
+        return {"enabled": self.available() and not self.disabled, "healthy": self.healthy,
+                "subscribed": len(self.subscribed), "disabled": self.disabled}
+
+    def drop(self):
+        self.ws.close()
+        self.session_id = None
+        self.healthy = False
+        self.subscribed = set()
+
+def _user_headers():
+    return {
+        "Client-ID": secrets["twitch"]["client_id"],
+        "Authorization": "Bearer " + secrets["twitch"]["access_token"],
+        "Content-Type": "application/json",
+    }
 
-async function addChannel(){
-  const name = (document.getElementById("newname").value||"").trim();
-  if(!name){ alert("Bitte Twitch-Login-Name eingeben."); return; }
-  const r = await fetch("/add_channel", {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({name})});
-  const js = await r.json();
-  if(!js.ok){ alert("Speichern fehlgeschlagen (evtl. Dateisystem read-only)."); return; }
-  document.getElementById("newname").value="";
-  await loadConfig();
-}
+async def web_quiet(until=None):
+    """Vor einem blockierenden Twitch-Request abgeben und warten, bis die Web-UI
+    WEB_PRIORITY_QUIET_SEC ruhig war – höchstens bis until (Standard: TWITCH_MAX_DEFER_SEC,
+    gleiche Regel wie in twitch_task)."""
+    await asyncio.sleep(0)
+    if until is None:
+        until = time.monotonic() + TWITCH_MAX_DEFER_SEC
+    while (time.monotonic() - last_http_activity) < WEB_PRIORITY_QUIET_SEC and time.monotonic() < until:
+        await asyncio.sleep(0.1)
+
+async def lookup_user_ids(logins, requests, until=None):
+    """login -> user_id über /helix/users (gebündelt, max. HELIX_MAX_LOGINS pro Anfrage)."""
+    ids = {}
+    for i in range(0, len(logins), HELIX_MAX_LOGINS):
+        chunk = logins[i:i + HELIX_MAX_LOGINS]
+        url = TWITCH_USERS_URL + "?" + "&".join("login=" + n for n in chunk)
+        await web_quiet(until)
+        r = requests.get(url, headers=_user_headers(), timeout=HTTP_TIMEOUT)
+        if r.status_code != 200:
+            r.content
+            raise RuntimeError("users HTTP " + str(r.status_code))
+        for u in r.json().get("data", []):
+            ids[u["login"].lower()] = u["id"]
+    return ids
+
+async def eventsub_subscribe(es, requests, deadline):
+    """stream.online/offline für die Kanäle in Prioritäts-Reihenfolge abonnieren (bis deadline)."""
+    logins = [ch["name"].strip().lower() for ch in config.get("channels", [])]
+    # Web-Vorrang für den ganzen Durchlauf zusammen höchstens TWITCH_MAX_DEFER_SEC; bis zum
+    # ersten Abo nur die halbe Frist, die andere Hälfte bleibt für die Requests selbst
+    defer_until = time.monotonic() + TWITCH_MAX_DEFER_SEC
+    urgent_until = min(defer_until, deadline - EVENTSUB_SUBSCRIBE_WINDOW / 2)
+    ids = await lookup_user_ids(logins, requests, urgent_until)
+    for login in logins:
+        # Twitchs Frist gilt nur bis zum ersten Abo; danach darf es länger dauern
+        if login not in ids or (not es.subscribed and time.monotonic() > deadline):
+            continue
+        until = defer_until if es.subscribed else urgent_until
+        for kind in ("stream.online", "stream.offline"):
+            body = {"type": kind, "version": "1",
+                    "condition": {"broadcaster_user_id": ids[login]},
+                    "transport": {"method": "websocket", "session_id": es.session_id}}
+            await web_quiet(until)
+            r = requests.post(TWITCH_SUBSCRIPTIONS_URL, json=body, headers=_user_headers(),
+                              timeout=HTTP_TIMEOUT)
+            status = r.status_code
+            r.content                 # Antwort ganz lesen -> Socket bleibt wiederverwendbar
+            if status == 401:
+                es.disabled = "user_token_invalid"
+                raise RuntimeError("EventSub: User-Token ungültig (401) → nur Polling.")
+            if status not in (202, 409):
+                log.warn("EventSub Abo %s %s HTTP %s", kind, login, status)
+                break
+        else:
+            es.subscribed.add(login)
+
+def eventsub_handle(es, message):
+    """Eine EventSub-Nachricht verarbeiten. Liefert eine reconnect_url oder None."""
+    msg = json.loads(message)
+    kind = msg.get("metadata", {}).get("message_type")
+    payload = msg.get("payload", {})
+    if kind == "session_welcome":
+        session = payload.get("session", {})
+        es.session_id = session.get("id")
+        es._keepalive = session.get("keepalive_timeout_seconds") or es._keepalive
+    elif kind == "notification":
+        sub_type = payload.get("subscription", {}).get("type")
+        login = payload.get("event", {}).get("broadcaster_user_login", "").lower()
+        if login and sub_type in ("stream.online", "stream.offline"):
+            log.info("EventSub: %s %s", sub_type, login)
+            update_live_state({login: sub_type == "stream.online"}, "push")
+    elif kind == "session_reconnect":
+        return payload.get("session", {}).get("reconnect_url")
+    elif kind == "revocation":
+        login = payload.get("subscription", {}).get("condition", {}).get("broadcaster_user_id")
+        log.warn("EventSub Abo widerrufen: %s", login)
+        es.healthy = False
+    return None
+
+async def eventsub_task(es, requests):
+    """Hält die EventSub-Verbindung; bei Fehlern/Stille Neuaufbau mit Backoff."""
+    url = EVENTSUB_URL
+    while True:
+        if not es.available() or es.disabled:
+            await asyncio.sleep(30)
+            continue
+        if not fleet_polls():
+            await asyncio.sleep(FLEET_HELLO_SEC)   # Follower: Push kommt über den Leader
+            continue
+        moved = False
+        try:
+            await web_quiet()             # TLS-Handshake blockiert -> nicht mitten in Web-Anfragen
+            es.ws.connect(url)
+            es._last_rx = time.monotonic()
+            welcome_deadline = es._last_rx + EVENTSUB_SUBSCRIBE_WINDOW
+            tried = bool(es.subscribed)   # nach einem Umzug bestehen die Abos weiter
+            while True:
+                reconnect_url = None
+                for message in es.ws.poll():
+                    es._last_rx = time.monotonic()
+                    reconnect_url = eventsub_handle(es, message) or reconnect_url
+                if reconnect_url:
+                    # Twitch zieht um: Abos gehen auf die neue Sitzung über
+                    es.ws.close()
+                    url = reconnect_url
+                    moved = True
+                    break
+                if es.session_id and not tried:
+                    tried = True
+                    await eventsub_subscribe(es, requests, welcome_deadline)
+                    es.healthy = bool(es.subscribed)
+                    es._backoff = 5
+                    log.info("EventSub aktiv für %d Kanäle.", len(es.subscribed))
+                if es.resubscribe or not fleet_polls():
+                    es.resubscribe = False
+                    es._backoff = 0
+                    break
+                if time.monotonic() - es._last_rx > es._keepalive + 5:
+                    raise OSError(errno.ETIMEDOUT, "keepalive")
+                await asyncio.sleep(0.2)
+        except Exception as e:
+            log.error("EventSub Fehler: %s", e)
+        if moved:
+            continue
+        url = EVENTSUB_URL
+        try:
+            es.drop()
+        except Exception as e:
+            log.error("EventSub Fehler beim Schließen: %s", e)
+        await asyncio.sleep(es._backoff)
+        es._backoff = min(max(es._backoff * 2, 5), EVENTSUB_BACKOFF_MAX)
 
-async function delChannel(name){
-  if(!confirm(`Streamer „${name}“ wirklich löschen?`)) return;
-  const r = await fetch("/delete_channel", {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({name})});
-  const js = await r.json();
-  if(!js.ok){ alert("Löschen fehlgeschlagen (evtl. Dateisystem read-only)."); return; }
-  await loadConfig();
-}
+# =========================
+#   Web UI – statische, vorkomprimierte Dateien im Flash (www/)
+# =========================
+WWW_ROOT = "www"              # www/index.html.gz wird mit tools/build_web.py erzeugt
+WWW_CHUNK = 1024              # Sendepuffer beim Streamen aus dem Flash
+
+_asset_etags = {}
+
+def asset_etag(path):
+    """ETag (CRC32 über den Dateiinhalt) einmalig berechnen und merken."""
+    tag = _asset_etags.get(path)
+    if tag is None:
+        crc = 0
+        buf = bytearray(WWW_CHUNK)
+        with open(path, "rb") as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                crc = binascii.crc32(memoryview(buf)[:n], crc)
+        tag = '"%08x"' % (crc & 0xFFFFFFFF)
+        _asset_etags[path] = tag
+    return tag
 
-async function saveOfflineColor(){
-  const hex = document.getElementById("offlineColor").value;
-  const r = await fetch("/set_offline_color", {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({color: hexToRgb(hex)})});
-  const js = await r.json();
-  if(!js.ok){ alert("Speichern fehlgeschlagen (evtl. Dateisystem read-only)."); }
-  await loadConfig();
-}
+def _file_exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+def serve_asset(request, filename, content_type):
+    """Liefert www/<filename> (bevorzugt .gz) gestreamt, mit ETag und 304 bei Treffer."""
+    gz = filename + ".gz"
+    headers = {"Cache-Control": "no-cache"}
+    if _file_exists(WWW_ROOT + "/" + gz):
+        filename = gz
+        headers["Content-Encoding"] = "gzip"
+    etag = asset_etag(WWW_ROOT + "/" + filename)
+    headers["ETag"] = etag
+    if request.headers.get("If-None-Match") == etag:
+        return Response(request, status=NOT_MODIFIED_304, headers=headers)
+    return FileResponse(request, filename, root_path=WWW_ROOT, headers=headers,
+                        content_type=content_type, buffer_size=WWW_CHUNK)
+
+# =========================
+#   Konfig-Operationen (Einzel-Routen und /batch)
+# =========================
+DEFAULT_LETTER = {"color": [0, 117, 179], "brightness": 0.3}
+BATCH_MAX_OPS = 32            # Obergrenze pro /batch-Request (RAM)
+EFFECT_NAME_MAX = 24          # Zeichen je Effektname
+
+def _clean_color(color):
+    return [max(0, min(255, int(color[0]))), max(0, min(255, int(color[1]))),
+            max(0, min(255, int(color[2])))]
+
+def _clean_brightness(value):
+    return max(0.0, min(1.0, float(value)))
+
+def _find_channel(name):
+    for ch in config["channels"]:
+        if ch["name"] == name:
+            return ch
+    return None
+
+def _channel_changed(name):
+    global display_dirty
+    frame_cache.invalidate(name)
+    invalidate_effects()           # "channel"-Keyframes hängen an den Kanalfarben
+    if last_online_channel and last_online_channel.get("name") == name:
+        display_dirty = True
+
+def apply_config_op(op):
+    """Eine Änderung auf config anwenden (ohne zu speichern). Liefert {"ok": ..., ...}.
+
+    op: "theme", "offline_color", "add", "delete", "reorder", "save" (alle fünf
+    Buchstaben) oder "patch" (Merge-Patch: nur die angegebenen Buchstaben/Felder).
+    """
+    kind = op.get("op")
+
+    if kind == "theme":
+        theme = "dark" if str(op.get("theme", "light")).lower() == "dark" else "light"
+        config.setdefault("ui", {})["theme"] = theme
+        return {"ok": True, "theme": theme}
+
+    if kind == "offline_color":
+        config["offline_color"] = _clean_color(op.get("color", [50, 50, 50]))
+        invalidate_effects()
+        return {"ok": True}
+
+    if kind == "effect_slot":
+        slot, name = op.get("slot"), str(op.get("name", ""))
+        if slot not in EFFECT_SLOTS or not effect_spec(name):
+            return {"ok": False, "err": "unknown slot/effect"}
+        config.setdefault("effect_slots", {})[slot] = name
+        return {"ok": True}
+
+    if kind == "reorder":
+        order = op.get("order", [])
+        by_name = {ch["name"]: ch for ch in config["channels"]}
+        if any(n not in by_name for n in order):
+            return {"ok": False, "err": "not found"}
+        ordered = [by_name[n] for n in order]
+        config["channels"] = ordered + [ch for ch in config["channels"] if ch["name"] not in order]
+        update_live_state({})         # Priorität geändert -> Anzeige neu wählen
+        return {"ok": True}
+
+    name = str(op.get("name", "")).strip()
+    if not name:
+        return {"ok": False, "err": "name missing"}
+
+    if kind == "effect":
+        spec = op.get("effect")
+        effects = config.setdefault("effects", {})
+        if spec is None:
+            if name not in effects:
+                return {"ok": False, "err": "not found"}   # eingebaute Effekte bleiben
+            del effects[name]
+        else:
+            if len(name) > EFFECT_NAME_MAX:
+                return {"ok": False, "err": "name too long"}
+            try:
+                compile_effect(spec, channel_cfg={"name": "", "letters": {}})
+            except Exception as e:
+                return {"ok": False, "err": "invalid effect: %s" % e}
+            effects[name] = spec
+        invalidate_effects()
+        return {"ok": True}
+
+    if kind == "add":
+        if _find_channel(name):
+            return {"ok": False, "err": "exists"}
+        new_ch = {"name": name, "letters": {L: dict(DEFAULT_LETTER) for L in LETTER_KEYS}}
+        config["channels"].append(new_ch)
+        frame_cache.invalidate(name)
+        status_cache.record((), "config")
+        if eventsub:
+            eventsub.resubscribe = True
+        return {"ok": True, "channel": new_ch}
+
+    if kind == "delete":
+        before = len(config["channels"])
+        config["channels"] = [c for c in config["channels"] if c.get("name") != name]
+        if len(config["channels"]) == before:
+            return {"ok": False, "err": "not found"}
+        frame_cache.invalidate(name)
+        if eventsub:
+            eventsub.resubscribe = True
+        update_live_state({})
+        return {"ok": True}
+
+    if kind in ("save", "patch"):
+        found = _find_channel(name)
+        if not found:
+            return {"ok": False, "err": "channel not found"}
+        new_letters = op.get("letters", {})
+        found_letters = found.get("letters", {})
+        # erst alle Buchstaben prüfen, dann übernehmen -> ein kaputter Wert ändert gar nichts
+        updated = {}
+        for L in LETTER_KEYS:
+            if kind == "patch":
+                if L not in new_letters:
+                    continue
+                v = found_letters.get(L, {})
+                v = {"color": v.get("color", [0, 0, 0]), "brightness": v.get("brightness", 0.5)}
+                v.update(new_letters[L])
+            else:
+                v = new_letters.get(L, {})
+            updated[L] = {
+                "color": _clean_color(v.get("color", [0, 0, 0])),
+                "brightness": _clean_brightness(v.get("brightness", 0.5)),
+            }
+        found.setdefault("letters", {}).update(updated)
+        _channel_changed(name)
+        return {"ok": True}
+
+    return {"ok": False, "err": "unknown op"}
+
+def _restore_config(backup):
+    """config auf einen früheren Stand zurücksetzen (gleiches dict-Objekt) und alles Abgeleitete verwerfen."""
+    global display_dirty
+    names = [ch["name"] for ch in config.get("channels", [])]
+    config.clear()
+    config.update(backup)
+    frame_cache.invalidate()
+    invalidate_effects()
+    status_cache.record((), "config")
+    if eventsub and names != [ch["name"] for ch in config.get("channels", [])]:
+        eventsub.resubscribe = True
+    update_live_state({})
+    display_dirty = True
+
+def apply_config_ops(ops):
+    """Mehrere Ops als Ganzes: scheitert eine, wird config auf den Stand davor zurückgesetzt.
+
+    Liefert die Einzelergebnisse; vor dem Fehler steht "rolled back", danach "skipped".
+    Einzelne Ops sind schon für sich atomar (sie prüfen alles, bevor sie ändern).
+    """
+    backup = json.loads(json.dumps(config)) if len(ops) > 1 else None
+    results = []
+    for op in ops:
+        try:
+            res = apply_config_op(op)
+        except Exception as e:
+            log.error("batch Fehler: %s", e)
+            res = {"ok": False, "err": "exception"}
+        results.append(res)
+        if not res["ok"]:
+            break
+    if all(r["ok"] for r in results):
+        return results
+    if backup is not None:
+        _restore_config(backup)
+    failed = len(results) - 1
+    return ([{"ok": False, "err": "rolled back"} for _ in range(failed)] + [results[-1]] +
+            [{"ok": False, "err": "skipped"} for _ in range(len(ops) - failed - 1)])
+
+# =========================
+#   Flottenmodus: ein Gerät fragt Twitch, alle zeigen an (UDP-Multicast)
+# =========================
+FLEET_VERSION = 2             # Frames mit anderer Version werden ignoriert (2: Zustand in Teilen)
+
+def _ip_bytes(ip):
+    return bytes(int(x) for x in ip.split("."))
+
+class Fleet:
+    """Leader/Follower für mehrere Schilder im selben Netz.
+
+    Alle Geräte melden sich regelmäßig per UDP. Ein amtierender Leader (schickt Zustands-
+    Frames) bleibt es; nur ohne ihn gewinnt das Gerät mit der kleinsten IP unter den zuletzt
+    gehörten. So übernimmt ein neu gestartetes Gerät nicht, auch wenn seine IP kleiner ist.
+    Nur der Leader fragt Twitch (und hält EventSub) und schickt den Live-Zustand als kleinen,
+    versionierten Frame; Follower zeigen ihn nur an. Bleibt der Leader FLEET_TIMEOUT_SEC
+    still, fällt er aus der Wahl und das nächste Gerät übernimmt.
+    """
+
+    def __init__(self, pool, node, group=FLEET_GROUP, port=FLEET_PORT):
+        self.node = node
+        self.group = group
+        self.port = port
+        self.mode = "multicast"
+        self.boot = random.randint(0, 65535)  # unterscheidet Neustarts (Sequenz beginnt wieder bei 0)
+        self.seq = 0
+        self.peers = {}               # ip -> monotonic, zuletzt gehört
+        self.leader = None
+        self.covered = set()          # Logins, die der Leader prüft
+        self._covering = set()        # ... aus den Teilen des gerade eintreffenden Zustands
+        self.dirty = True             # Zustand geändert -> sofort senden
+        self.rx = 0
+        self.tx = 0
+        self.oversize = 0             # verworfene Frames über FLEET_FRAME_MAX
+        self._seen = {}               # ip -> (boot, seq) des letzten übernommenen Zustands
+        self._leading = {}            # ip -> monotonic des letzten Zustands-Frames (amtierend)
+        self._send_at = 0.0
+        self._listen_until = time.monotonic() + FLEET_LISTEN_SEC
+        self._buf = bytearray(FLEET_FRAME_MAX + 1)   # ein Byte mehr: volles Puffer = abgeschnitten
+        self.sock = self._open(pool)
+
+    def _open(self, pool):
+        sock = pool.socket(pool.AF_INET, pool.SOCK_DGRAM)
+        reuse = getattr(pool, "SO_REUSEADDR", None)
+        if reuse is not None:
+            sock.setsockopt(pool.SOL_SOCKET, reuse, 1)   # mehrere Sim-Knoten auf einem PC
+        sock.bind(("0.0.0.0", self.port))
+        try:
+            sock.setsockopt(pool.IPPROTO_IP, pool.IP_ADD_MEMBERSHIP,
+                            _ip_bytes(self.group) + _ip_bytes(self.node))
+            multicast_if = getattr(pool, "IP_MULTICAST_IF", None)
+            if multicast_if is not None:
+                sock.setsockopt(pool.IPPROTO_IP, multicast_if, _ip_bytes(self.node))
+        except (AttributeError, OSError, TypeError) as e:
+            # Ohne Multicast-Unterstützung im Stack: Broadcast im eigenen Netz
+            log.warn("Flotte: kein Multicast (%s) → Broadcast.", e)
+            self.mode = "broadcast"
+            self.group = "255.255.255.255"
+        sock.settimeout(0)
+        return sock
+
+    def _key(self, ip):
+        return tuple(int(x) for x in ip.split("."))
+
+    def polls(self):
+        """True, wenn dieses Gerät selbst Twitch fragen soll."""
+        return self.leader == self.node
+
+    def poll_logins(self, logins):
+        """Welche der eigenen Kanäle dieses Gerät selbst prüfen muss."""
+        if self.polls():
+            return logins
+        if self.leader not in self._seen:
+            return []                 # Zuhörphase bzw. noch kein Zustand vom Leader
+        return [n for n in logins if n not in self.covered]
+
+    def _send(self, frame):
+        data = json.dumps(frame).encode("utf-8")
+        if len(data) > FLEET_FRAME_MAX:
+            self.oversize += 1
+            log.warn("Flotte: Frame mit %d Bytes zu groß, nicht gesendet.", len(data))
+            return
+        try:
+            self.sock.sendto(data, (self.group, self.port))
+            self.tx += 1
+        except OSError as e:
+            log.warn("Flotte: senden fehlgeschlagen: %s", e)
+
+    def _parts(self, checked):
+        """Kanalliste so aufteilen, dass jeder Zustands-Frame höchstens FLEET_FRAME_MAX Bytes hat.
+
+        Gerechnet wird mit der echten Kodierung: der Kopf mit leeren Listen (Zahlen im
+        ungünstigsten Fall) plus je Login seine JSON-Länge und das ", " davor – in "a" und,
+        falls live, noch einmal in "l".
+        """
+        worst = len(checked) + 1
+        head = len(json.dumps({"v": FLEET_VERSION, "k": "s", "n": self.node, "b": 65535,
+                               "q": self.seq + worst, "p": worst, "t": worst, "a": [], "l": []}))
+        parts = [[]]
+        size = head
+        for n in checked:
+            need = (len(json.dumps(n)) + 2) * (2 if live_state.get(n) else 1)
+            if parts[-1] and size + need > FLEET_FRAME_MAX:
+                parts.append([])
+                size = head
+            parts[-1].append(n)
+            size += need
+        return parts
+
+    def _receive(self, now):
+        while True:
+            try:
+                n, addr = self.sock.recvfrom_into(self._buf)
+            except OSError:
+                return                # nichts mehr da (EAGAIN)
+            if n >= len(self._buf):
+                # Puffer voll -> Frame war länger als FLEET_FRAME_MAX und ist abgeschnitten
+                self.oversize += 1
+                log.warn("Flotte: Frame von %s größer als %d Bytes, verworfen.", addr[0], FLEET_FRAME_MAX)
+                continue
+            try:
+                frame = json.loads(str(self._buf[:n], "utf-8"))
+            except (ValueError, UnicodeError):
+                continue
+            if frame.get("v") != FLEET_VERSION or frame.get("n") in (None, self.node):
+                continue
+            self.rx += 1
+            self.peers[frame["n"]] = now
+            if frame.get("k") == "s":
+                self._state(frame, now)
+
+    def _state(self, frame, now):
+        node = frame["n"]
+        self._leading[node] = now
+        if node != self._elect(now):
+            return                    # nicht (mehr) unser Leader
+        stamp = (frame.get("b"), frame.get("q", 0))
+        last = self._seen.get(node)
+        if last and last[0] == stamp[0] and last[1] >= stamp[1]:
+            return                    # veraltet/doppelt
+        self._seen[node] = stamp
+        checked = frame.get("a", [])
+        live = frame.get("l", [])
+        # Zustand kommt in Teilen ("p" von "t"); abgedeckt ist erst, was alle Teile nennen
+        part, total = frame.get("p", 0), frame.get("t", 1)
+        if part == 0:
+            self._covering = set()
+        self._covering.update(checked)
+        if part == total - 1:
+            self.covered = self._covering
+            self._covering = set()
+        update_live_state({n: n in live for n in checked}, "fleet")
+        event_hub.checked(checked)
+
+    def _elect(self, now):
+        """Amtierende Leader behalten das Amt (bei zweien die kleinere IP); sonst die kleinste IP."""
+        nodes = [ip for ip, t in self._leading.items() if now - t <= FLEET_TIMEOUT_SEC]
+        if self.leader == self.node:
+            nodes.append(self.node)
+        if not nodes:
+            nodes = list(self.peers) + [self.node]
+        return min(nodes, key=self._key)
+
+    def poll(self, now):
+        self._receive(now)
+        for ip, seen in list(self.peers.items()):
+            if now - seen > FLEET_TIMEOUT_SEC:
+                del self.peers[ip]
+                self._seen.pop(ip, None)
+                self._leading.pop(ip, None)
+                log.info("Flotte: %s verstummt.", ip)
+        leader = self._elect(now)
+        if leader == self.node and now < self._listen_until:
+            leader = None             # erst hören, ob es schon einen Leader gibt
+        if leader != self.leader:
+            log.info("Flotte: Leader ist jetzt %s", leader or "(offen)")
+            self.leader = leader
+            self.covered = set()
+            self._covering = set()
+            self._seen.pop(leader, None)  # Abdeckung erst mit dem nächsten Zustand -> bis dahin nichts selbst prüfen
+            self.dirty = True
+        if self.polls():
+            if self.dirty or now >= self._send_at:
+                self.dirty = False
+                checked = [ch["name"].strip().lower() for ch in config.get("channels", [])]
+                parts = self._parts(checked)
+                for i, part in enumerate(parts):
+                    self.seq += 1
+                    self._send({"v": FLEET_VERSION, "k": "s", "n": self.node, "b": self.boot,
+                                "q": self.seq, "p": i, "t": len(parts), "a": part,
+                                "l": [n for n in part if live_state.get(n)]})
+                self._send_at = now + FLEET_STATE_SEC
+        elif now >= self._send_at:
+            self._send({"v": FLEET_VERSION, "k": "h", "n": self.node})
+            self._send_at = now + FLEET_HELLO_SEC
+
+    def status(self):
+        return {"mode": self.mode, "node": self.node, "leader": self.leader,
+                "peers": sorted(self.peers, key=self._key), "rx": self.rx, "tx": self.tx,
+                "oversize": self.oversize}
+
+def fleet_polls():
+    return fleet is None or fleet.polls()
 
-loadConfig();
-</script>
-</body>
-</html>
-"""
+# =========================
+#   Live-Updates an die Web-UI (Server-Sent Events, /events)
+# =========================
+class EventHub:
+    """Sammelt Änderungen als kleine Deltas und schickt sie gebündelt an alle /events-Clients.
+
+    Pro Art gibt es genau einen ausstehenden Eintrag (neuere Werte überschreiben ältere),
+    der Speicher wächst also weder mit der Zeit noch mit der Zahl der Clients.
+    """
+
+    def __init__(self):
+        self.clients = []             # SSEResponse-Objekte, max. SSE_MAX_CLIENTS
+        self._fresh = []              # neue Clients: bekommen beim nächsten flush() "hello"
+        self._ping_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        self._live = {}               # login -> live
+        self._channel = False         # angezeigter Kanal (False = unverändert)
+        self._checked = set()         # gerade geprüfte Logins
+        self._config = []             # angewandte Konfig-Änderungen
+        self._config_src = None       # X-Client des Tabs, der sie gemacht hat
+        self._persist = False
+
+    def connect(self, request):
+        if len(self.clients) >= SSE_MAX_CLIENTS:
+            self._drop(self.clients[0])
+        sse = SSEResponse(request)
+        self.clients.append(sse)
+        self._fresh.append(sse)       # Header gehen erst nach dem Handler raus
+        return sse
+
+    def hello(self, sse):
+        """Erster Stand für einen neuen Client (nach dem Senden der Header)."""
+        self._send(sse, "hello", {"live": live_state, "channel": _login(last_online_channel),
+                                  "checked_ago": poll_scheduler.checked_ago(time.monotonic()),
+                                  "persist": config_store.status()})
+
+    def live(self, delta, current):
+        self._live.update(delta)
+        self._channel = _login(current)
+
+    def checked(self, logins):
+        self._checked.update(logins)
+
+    def config(self, items, src=None):
+        if len(self._config) + len(items) > BATCH_MAX_OPS:
+            self._config = [{"op": "reload"}]
+        else:
+            self._config.extend(items)
+        self._config_src = src
+        self._persist = True
+
+    def persist(self):
+        self._persist = True
+
+    def flush(self, now):
+        if not self.clients:
+            self._reset()             # niemand hört zu -> nichts aufheben
+            return
+        fresh, self._fresh = self._fresh, []
+        for sse in fresh:
+            self.hello(sse)
+            self._ping_at = now + SSE_KEEPALIVE_SEC
+        events = []
+        if self._live or self._channel is not False:
+            events.append(("live", {"changes": self._live, "channel": self._channel}))
+        if self._checked:
+            events.append(("checked", {"logins": sorted(self._checked)}))
+        if self._config:
+            events.append(("config", {"src": self._config_src, "ops": self._config}))
+        if self._persist:
+            events.append(("persist", config_store.status()))
+        if not events and now >= self._ping_at:
+            events.append(("ping", {}))
+        if not events:
+            return
+        self._reset()
+        self._ping_at = now + SSE_KEEPALIVE_SEC
+        for kind, data in events:
+            text = json.dumps(data)
+            for sse in list(self.clients):
+                self._send(sse, kind, text)
+
+    def _send(self, sse, kind, data):
+        try:
+            sse.send_event(data if isinstance(data, str) else json.dumps(data), event=kind)
+        except Exception:
+            self._drop(sse)
+
+    def _drop(self, sse):
+        if sse in self.clients:
+            self.clients.remove(sse)
+        if sse in self._fresh:
+            self._fresh.remove(sse)
+        try:
+            sse.close()
+        except Exception:
+            pass
+
+def _login(ch):
+    return ch["name"].strip().lower() if ch else None
+
+def config_event(op, res):
+    """Eine angewandte Konfig-Änderung so beschreiben, dass andere Tabs sie direkt übernehmen können."""
+    kind = op.get("op")
+    if kind == "theme":
+        return {"op": "theme", "theme": res["theme"]}
+    if kind == "offline_color":
+        return {"op": "offline_color", "color": config["offline_color"]}
+    if kind == "reorder":
+        return {"op": "reorder", "order": [ch["name"] for ch in config["channels"]]}
+    if kind == "add":
+        return {"op": "add", "channel": res["channel"]}
+    if kind == "delete":
+        return {"op": "delete", "name": str(op.get("name", "")).strip()}
+    if kind in ("effect", "effect_slot"):
+        return {"op": "effects", "effects": config.get("effects", {}), "slots": config.get("effect_slots", {})}
+    return {"op": "channel", "channel": _find_channel(str(op.get("name", "")).strip())}
+
+event_hub = EventHub()
 
 # =========================
 #   Webserver-Handler
@@ -427,241 +2515,454 @@ def build_server(pool):
     srv = Server(pool, debug=False)
 
     def touch_http_activity():
-        global web_lock_until
-        web_lock_until = time.monotonic() + WEB_LOCK_DURATION_SEC
+        global last_http_activity
+        last_http_activity = time.monotonic()
+
+    def route(path, methods=GET):
+        # wie srv.route, misst aber jeden Handler (onair_http_seconds{route=...})
+        def deco(fn):
+            return srv.route(path, methods)(timed("onair_http_seconds", 'route="%s"' % path)(fn))
+        return deco
 
-    @srv.route("/", GET)
+    @route("/", GET)
     def index(request: Request):
         touch_http_activity()
-        return Response(request, content_type="text/html", body=HTML_PAGE)
+        return serve_asset(request, "index.html", "text/html; charset=utf-8")
 
-    @srv.route("/config", GET)
+    @route("/config", GET)
     def get_config(request: Request):
         touch_http_activity()
         data = {
             "channels": config.get("channels", []),
             "offline_color": config.get("offline_color", [50, 50, 50]),
             "ui": config.get("ui", {"theme": "light"}),
+            "persist": config_store.status(),
+            "eventsub": eventsub.status() if eventsub else None,
+            "boot": boot_phases,
+            "net": twitch_net.status() if twitch_net else None,
+            "fleet": fleet.status() if fleet else None,
+            "render": renderer.status(),
+            "wifi": wifi_sup.status(),
+            "effects": {n: effect_spec(n) for n in effect_names()},
+            "effect_slots": {slot: slot_effect_name(slot) for slot in EFFECT_SLOTS},
         }
         return JSONResponse(request, data)
 
-    @srv.route("/set_ui_theme", POST)
-    def set_ui_theme(request: Request):
+    def _single_op(request, op, label):
         touch_http_activity()
         try:
             body = request.json()
-            theme = body.get("theme", "light")
-            if "ui" not in config:
-                config["ui"] = {}
-            config["ui"]["theme"] = "dark" if str(theme).lower() == "dark" else "light"
-            ok = save_json("config.json", config)
-            if not ok:
-                return JSONResponse(request, {"ok": False, "err": "read_only_fs"})
-            return JSONResponse(request, {"ok": True, "theme": config["ui"]["theme"]})
+            body["op"] = op
+            res = apply_config_op(body)
+            if res["ok"]:
+                config_store.mark_dirty()
+                event_hub.config([config_event(body, res)], request.headers.get("X-Client"))
+                res["persist"] = config_store.status()
+            return JSONResponse(request, res)
         except Exception as e:
-            print("set_ui_theme Fehler:", e)
+            log.error("%s Fehler: %s", label, e)
             return JSONResponse(request, {"ok": False, "err": "exception"})
 
-    @srv.route("/save_channel", POST)
-    def save_channel(request: Request):
-        touch_http_activity()
-        try:
-            body = request.json()
-            name = body.get("name", "").strip()
-            new_letters = body.get("letters", {})
-            if not name:
-                return JSONResponse(request, {"ok": False, "err": "name missing"})
-
-            found = None
-            for ch in config["channels"]:
-                if ch["name"] == name:
-                    found = ch
-                    break
-            if not found:
-                return JSONResponse(request, {"ok": False, "err": "channel not found"})
+    @route("/set_ui_theme", POST)
+    def set_ui_theme(request: Request):
+        return _single_op(request, "theme", "set_ui_theme")
 
-            found_letters = found.setdefault("letters", {})
-            for L in ["O", "N", "A", "I", "R"]:
-                v = new_letters.get(L, {})
-                color = v.get("color", [0, 0, 0])
-                bri = float(v.get("brightness", 0.5))
-                found_letters[L] = {
-                    "color": [int(color[0]), int(color[1]), int(color[2])],
-                    "brightness": bri
-                }
+    @route("/save_channel", POST)
+    def save_channel(request: Request):
+        return _single_op(request, "save", "save_channel")
 
-            ok = save_json("config.json", config)
-            if not ok:
-                return JSONResponse(request, {"ok": False, "err": "read_only_fs"})
+    @route("/add_channel", POST)
+    def add_channel(request: Request):
+        return _single_op(request, "add", "add_channel")
 
-            global last_online_channel
-            if last_online_channel and last_online_channel.get("name") == name:
-                set_letter_colors(found)
+    @route("/delete_channel", POST)
+    def delete_channel(request: Request):
+        return _single_op(request, "delete", "delete_channel")
 
-            return JSONResponse(request, {"ok": True})
-        except Exception as e:
-            print("save_channel Fehler:", e)
-            return JSONResponse(request, {"ok": False, "err": "exception"})
+    @route("/set_offline_color", POST)
+    def set_offline_color(request: Request):
+        return _single_op(request, "offline_color", "set_offline_color")
 
-    @srv.route("/add_channel", POST)
-    def add_channel(request: Request):
+    @route("/batch", POST)
+    def batch(request: Request):
+        """{"ops": [...]} in einem Request anwenden; genau ein Persistenz-Durchlauf."""
         touch_http_activity()
         try:
-            body = request.json()
-            name = body.get("name", "").strip()
-            if not name:
-                return JSONResponse(request, {"ok": False, "err": "name missing"})
-
-            for ch in config["channels"]:
-                if ch["name"] == name:
-                    return JSONResponse(request, {"ok": False, "err": "exists"})
-
-            default = {"color": [0, 117, 179], "brightness": 0.3}
-            new_ch = {"name": name, "letters": {L: dict(default) for L in ["O", "N", "A", "I", "R"]}}
-            config["channels"].append(new_ch)
-
-            ok = save_json("config.json", config)
-            if not ok:
-                return JSONResponse(request, {"ok": False, "err": "read_only_fs"})
-
-            return JSONResponse(request, {"ok": True})
+            ops = request.json().get("ops", [])
+            if len(ops) > BATCH_MAX_OPS:
+                return JSONResponse(request, {"ok": False, "err": "too many ops"})
+            results = apply_config_ops(ops)
+            if all(r["ok"] for r in results) and results:
+                config_store.mark_dirty()
+                event_hub.config([config_event(op, r) for op, r in zip(ops, results) if r["ok"]],
+                                 request.headers.get("X-Client"))
+            return JSONResponse(request, {"ok": all(r["ok"] for r in results),
+                                          "results": results,
+                                          "persist": config_store.status()})
         except Exception as e:
-            print("add_channel Fehler:", e)
+            log.error("batch Fehler: %s", e)
             return JSONResponse(request, {"ok": False, "err": "exception"})
 
-    @srv.route("/delete_channel", POST)
-    def delete_channel(request: Request):
+    @route("/effect", GET)
+    def get_effect(request: Request):
+        """Kompilierte Tabelle als Hex für die Vorschau in der Web-UI (?name=...&channel=...)."""
+        touch_http_activity()
+        name = request.query_params.get("name") or ""
+        if not effect_spec(name):
+            return JSONResponse(request, {"ok": False, "err": "not found"})
+        frames, step, repeat = effect_table(name, _find_channel(request.query_params.get("channel") or ""))
+        return JSONResponse(request, {"ok": True, "step": step, "repeat": repeat,
+                                      "letters": LETTER_KEYS,
+                                      "frames": binascii.hexlify(frames).decode()})
+
+    @route("/preview_effect", POST)
+    def preview_effect(request: Request):
+        """Effekt einmal auf dem Schild zeigen; danach wieder der aktuelle Stand."""
         touch_http_activity()
         try:
             body = request.json()
-            name = body.get("name", "").strip()
-            if not name:
-                return JSONResponse(request, {"ok": False, "err": "name missing"})
-
-            before = len(config["channels"])
-            config["channels"] = [c for c in config["channels"] if c.get("name") != name]
-            if len(config["channels"]) == before:
+            name = str(body.get("name", ""))
+            if not effect_spec(name):
                 return JSONResponse(request, {"ok": False, "err": "not found"})
-
-            ok = save_json("config.json", config)
-            if not ok:
-                return JSONResponse(request, {"ok": False, "err": "read_only_fs"})
-
+            channel = _find_channel(str(body.get("channel", ""))) or last_online_channel
+            effect = table_effect(effect_table(name, channel))
+            if last_online_channel:
+                effect = chain(effect, letters_effect(last_online_channel))
+            animator.play(effect, interrupt=True)
             return JSONResponse(request, {"ok": True})
         except Exception as e:
-            print("delete_channel Fehler:", e)
+            log.error("preview_effect Fehler: %s", e)
             return JSONResponse(request, {"ok": False, "err": "exception"})
 
-    @srv.route("/set_offline_color", POST)
-    def set_offline_color(request: Request):
+    @route("/status", GET)
+    def get_status(request: Request):
+        # nur Cache: keine Twitch-Anfrage, kein touch_http_activity() (Tools dürfen oft fragen)
+        etag = status_cache.etag()
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Access-Control-Allow-Origin": "*"}
+        if request.headers.get("If-None-Match") == etag:
+            return Response(request, status=NOT_MODIFIED_304, headers=headers)
+        return Response(request, status_cache.body(), headers=headers, content_type="application/json")
+
+    @route("/events", GET)
+    def events(request: Request):
         touch_http_activity()
+        return event_hub.connect(request)
+
+    @route("/schedule", GET)
+    def get_schedule(request: Request):
+        logins = [ch["name"].strip().lower() for ch in config.get("channels", [])]
+        snap = poll_scheduler.snapshot(logins, time.monotonic())
+        snap["ratelimit"] = rate_governor.status()
+        return JSONResponse(request, snap)
+
+    @route("/metrics", GET)
+    def get_metrics(request: Request):
+        # kein touch_http_activity(): Abfragen durch Prometheus sollen Twitch nicht verzögern
+        free = sample_mem()
+        gauges = [
+            ("onair_uptime_seconds", int(time.monotonic() - boot_time)),
+            ("onair_mem_free_bytes", free),
+            ("onair_mem_free_low_bytes", mem_low),
+            ("onair_config_writes_total", config_store.writes),
+            ("onair_config_pending", config_store.pending),
+            ("onair_ratelimit_remaining", rate_governor.remaining),
+            ("onair_ratelimit_deferred_total", rate_governor.deferred),
+            ("onair_eventsub_healthy", int(eventsub.healthy) if eventsub else None),
+            ("onair_wifi_rssi_dbm", wifi.radio.ap_info.rssi if wifi.radio.ap_info else None),
+            ("onair_frames_rendered_total", renderer.rendered),
+            ('onair_frames_skipped_total{reason="unchanged"}', renderer.unchanged),
+            ('onair_frames_skipped_total{reason="fps_cap"}', renderer.dropped),
+        ]
+        return Response(request, render_metrics(gauges), content_type="text/plain; version=0.0.4")
+
+    @route("/logs", GET)
+    def get_logs(request: Request):
+        """Ringpuffer ab Cursor: /logs?since=<next der letzten Antwort>&level=warn."""
+        # kein touch_http_activity(): Mitlesen soll Twitch nicht verzögern
         try:
-            body = request.json()
-            color = body.get("color", [50, 50, 50])
-            config["offline_color"] = [int(color[0]), int(color[1]), int(color[2])]
-
-            ok = save_json("config.json", config)
-            if not ok:
-                return JSONResponse(request, {"ok": False, "err": "read_only_fs"})
-
-            return JSONResponse(request, {"ok": True})
-        except Exception as e:
-            print("set_offline_color Fehler:", e)
-            return JSONResponse(request, {"ok": False, "err": "exception"})
+            since = int(request.query_params.get("since") or 0)
+        except ValueError:
+            since = 0
+        level = _log_level(request.query_params.get("level"), 0)
+        return JSONResponse(request, log.read(since, level))
+
+    @route("/flush", POST)
+    def flush_config(request: Request):
+        touch_http_activity()
+        ok = config_store.flush()
+        event_hub.persist()
+        if not ok:
+            return JSONResponse(request, {"ok": False, "err": "read_only_fs",
+                                          "persist": config_store.status()})
+        return JSONResponse(request, {"ok": True, "persist": config_store.status()})
 
     return srv
 
 # =========================
-#   Hauptprogramm
+#   Laufzeit: kooperative asyncio-Tasks
 # =========================
-def main():
-    global last_online_channel, boot_time, web_lock_until, ui_config_seen
-
-    connecting_effect()
-    if not connect_to_wifi():
-        while True:
-            standby_effect([50, 0, 0])
-
-    pool = socketpool.SocketPool(wifi.radio)
-    ssl_context = ssl.create_default_context()
-    requests = adafruit_requests.Session(pool, ssl_context)
-
-    server = build_server(pool)
-    server.start(str(wifi.radio.ipv4_address), port=8080)
-    print("Webserver läuft auf http://%s:8080/" % wifi.radio.ipv4_address)
-    print("Ready to check Twitch status!")
+async def task_failed(task, e):
+    """Unerwartete Ausnahme in einer Task-Schleife: protokollieren, zählen, kurz pausieren.
+
+    Der Task läuft danach weiter – wie früher die Hauptschleife, die jeden Durchlauf abfing.
+    """
+    count("onair_task_errors_total", 'task="%s"' % task)
+    log.error("%s-Task Fehler: %s", task, e)
+    await asyncio.sleep(TASK_ERROR_BACKOFF_SEC)
+
+async def http_task(server):
+    """Bedient den Webserver; gibt nach jedem poll() an die anderen Tasks ab."""
+    poll = timed("onair_loop_seconds", 'task="http"')(server.poll)
+    while True:
+        try:
+            poll()
+        except Exception as e:
+            log.error("Server poll Fehler: %s", e)
+        await asyncio.sleep(HTTP_POLL_INTERVAL)
 
-    # Sofort eine gedimmte Offline-Anzeige
-    base_b = 0.2
-    col = [int(c * base_b) for c in config.get("offline_color", [50, 50, 50])]
-    pixels.fill(col); pixels.show()
+async def twitch_task(requests, server):
+    """Prüft fällige Kanäle (siehe PollScheduler) gebündelt; schreibt nur den Anzeige-Zustand.
 
-    boot_time = time.monotonic()
-    last_check = time.monotonic() - CHECK_INTERVAL  # erster Zyklus nach Schonfrist möglich
+    Der Webserver hat Vorrang: Eine fällige Abfrage wartet, solange Webrequests kommen –
+    aber nie länger als TWITCH_MAX_DEFER_SEC. Die Abfrage selbst ist kurz (ein Request,
+    max. HTTP_TIMEOUT) und bedient den Server davor und zwischen Teilanfragen.
+    """
+    global error_pending
+    due_since = None
 
     while True:
-        # Webserver-Events abarbeiten (nicht-blockierend)
+        await asyncio.sleep(0.1)
         try:
-            server.poll()
+            now = time.monotonic()
+
+            channels = config.get("channels", [])
+            logins = [ch["name"].strip().lower() for ch in channels]
+            if fleet:
+                logins = fleet.poll_logins(logins)   # Follower: Leader prüft für uns
+            due = poll_scheduler.due(logins, now)
+            if not due:
+                due_since = None
+                continue
+            if due_since is None:
+                due_since = now
+            # Web aktiv -> kurz zurückstellen, solange die Höchstwartezeit nicht erreicht ist
+            if (now - last_http_activity) < WEB_PRIORITY_QUIET_SEC and (now - due_since) < TWITCH_MAX_DEFER_SEC:
+                continue
+            # Twitch drosselt gerade (Ratelimit-Header) -> verschieben, nicht senden
+            if rate_governor.wait_time(now) > 0:
+                continue
+            # Kein Token (Backoff) -> nichts senden, kein Budget verbrauchen, Kanäle bleiben fällig
+            if token_blocked():
+                continue
+            if not poll_scheduler.take_budget(now):
+                continue
+            # erst zählen, wenn die Abfrage wirklich rausgeht
+            if now - due_since >= TWITCH_MAX_DEFER_SEC:
+                poll_scheduler.forced += 1
         except Exception as e:
-            print("Server poll Fehler:", e)
-
-        now = time.monotonic()
-
-        # Twitch pausieren, wenn kürzlich Web aktiv war
-        if now < web_lock_until:
-            if not last_online_channel:
-                standby_effect(config.get("offline_color", [50, 50, 50]))
-            time.sleep(0.005)
+            due_since = None
+            await task_failed("twitch", e)
             continue
 
-        # Start-Schonfrist rein zeitbasiert
-        if (now - boot_time) < STARTUP_GRACE_SEC:
-            if not last_online_channel:
-                standby_effect(config.get("offline_color", [50, 50, 50]))
-            time.sleep(0.005)
-            continue
+        live_result = {}
+        polled = False
+        try:
+            # 1) Token sicherstellen
+            token = ensure_token(requests)
+            # Wenn Token nicht da (Backoff): Zyklus überspringen, Kanäle bleiben fällig
+            if not token:
+                log.debug("Token nicht verfügbar (Backoff) → Zyklus überspringen.")
+                continue
+            polled = True
+            await asyncio.sleep(0)
+
+            # 2) Alle fälligen Channels in EINER Abfrage prüfen
+            live_result = fetch_live_channels(due, requests, server=server, token_cached=token)
+
+            # 3) Anzeige-Zustand an den LED-Task übergeben
+            update_live_state(live_result)
+            if live_result:
+                mark_boot("first_check")
+                if not display_dirty:
+                    mark_boot("first_correct_frame")   # wiederhergestellter Stand stimmte schon
 
-        # Ein kompletter Twitch-Zyklus max. alle CHECK_INTERVAL Sekunden
-        if now - last_check >= CHECK_INTERVAL:
-            last_check = now
+        except Exception as e:
+            log.error("Twitch-Task Fehler: %s", e)
+            error_pending = True
+        finally:
+            due_since = None
             try:
-                # 1) Token EINMAL pro Zyklus sicherstellen
-                token = ensure_token(requests)
-                # Wenn Token nicht da (Backoff): Zyklus überspringen
-                if not token:
-                    print("Token nicht verfügbar (Backoff) → Zyklus überspringen.")
-                    continue
+                shown = last_online_channel["name"].strip().lower() if last_online_channel else None
+                pushed = eventsub.subscribed if (eventsub and eventsub.healthy) else ()
+                # Gedrosselte Kanäle bleiben fällig und kommen nach dem Reset als Erste dran;
+                # ohne Request (kein Token) wurde gar nichts geprüft
+                if not polled:
+                    checked = []
+                elif rate_governor.wait_time(time.monotonic()) == 0:
+                    checked = due
+                else:
+                    checked = list(live_result)
+                poll_scheduler.done(checked, logins, time.monotonic(), shown, pushed)
+                event_hub.checked(live_result)
+            except Exception as e:
+                log.error("Twitch-Task Fehler (Nachbereitung): %s", e)
 
-                # 2) Channels in Prioritäts-Reihenfolge prüfen
-                current_online_channel = None
-                for ch in config.get("channels", []):
-                    if is_channel_online(ch["name"], requests, server=server, token_cached=token):
-                        current_online_channel = ch
-                        break
-                    # Nach jedem Call Server kurz bedienen
-                    try:
-                        server.poll()
-                    except Exception as e:
-                        print("Server poll innerhalb Twitch-Schleife:", e)
-
-                # 3) LEDs setzen
-                if current_online_channel:
-                    if (not last_online_channel) or (current_online_channel.get("name") != last_online_channel.get("name")):
-                        knight_rider_effect([255, 0, 0], cycles=2)
-                    set_letter_colors(current_online_channel)
+def _standby_idle():
+    return slot_effect("standby")
+
+def _offline_idle():
+    return slot_effect("standby", offline=(50, 0, 0))
+
+async def led_task():
+    """Rendert den aktuellen Anzeige-Zustand über den Animator; blockiert nie länger als ein Frame."""
+    global display_dirty, error_pending
+    tick = timed("onair_loop_seconds", 'task="led"')(animator.tick)
+    shown = last_online_channel    # aus state.json wiederhergestellt -> ohne Lauflicht weiter
+    if not shown:
+        animator.set_idle(_standby_idle)
+    while True:
+        try:
+            if error_pending:
+                error_pending = False
+                animator.play(slot_effect("error"), interrupt=True)
+                display_dirty = True
+
+            if display_dirty:
+                display_dirty = False
+                current = last_online_channel
+                if current:
+                    animator.set_idle(None)
+                    if (not shown) or (current.get("name") != shown.get("name")):
+                        animator.play(chain(slot_effect("change", current),
+                                            letters_effect(current)), interrupt=not animator.busy)
+                    else:
+                        animator.play(letters_effect(current), interrupt=not animator.busy)
                 else:
-                    standby_effect(config.get("offline_color", [50, 50, 50]))
+                    animator.set_idle(_standby_idle)
+                shown = current
+                if "first_check" in boot_phases:
+                    mark_boot("first_correct_frame")
+
+            now = time.monotonic()
+            wait = tick(now)
+            pending = renderer.present(now, animator.stepped)
+            animator.stepped = False
+            if pending is not None:
+                wait = min(wait, pending)
+        except Exception as e:
+            # z. B. kaputter Effekt-Generator: verwerfen, aktuellen Stand neu zeichnen
+            animator.stop()
+            display_dirty = True
+            await task_failed("led", e)
+            continue
+        await asyncio.sleep(min(max(wait, LED_FRAME_INTERVAL), LED_IDLE_INTERVAL))
 
-                last_online_channel = current_online_channel
+async def persist_task():
+    """Schreibt config.json verzögert und gebündelt (siehe ConfigStore) sowie state.json."""
+    while True:
+        await asyncio.sleep(0.5)
+        try:
+            if config_store.due(time.monotonic()):
+                config_store.flush()
+                event_hub.persist()
+            if state_dirty:
+                save_state()
+            elif (time.monotonic() - state_saved_at > STATE_REFRESH_SEC
+                  and _login(last_online_channel) in status_cache.entries):
+                save_state()              # "seen" aktuell halten, solange der Kanal live bleibt
+            sample_mem()
+        except Exception as e:
+            await task_failed("persist", e)
 
-            except Exception as e:
-                print("Main loop Fehler:", e)
-                error_effect()
-                if not wifi.radio.connected:
-                    connect_to_wifi()
+async def fleet_task():
+    """Flottenmodus: Frames empfangen, Leader wählen, Zustand bzw. Hello senden."""
+    while True:
+        await asyncio.sleep(0.1)
+        try:
+            fleet.poll(time.monotonic())
+        except Exception as e:
+            await task_failed("fleet", e)
+
+async def events_task():
+    """Schickt gesammelte Änderungen an die /events-Clients (siehe EventHub)."""
+    while True:
+        await asyncio.sleep(SSE_PUSH_INTERVAL)
+        try:
+            event_hub.flush(time.monotonic())
+        except Exception as e:
+            await task_failed("events", e)
+
+async def wifi_task(server):
+    """Überwacht die WLAN-Verbindung (WifiSupervisor.check) und verbindet bei Verlust neu."""
+    bound = str(wifi.radio.ipv4_address)
+    while True:
+        await asyncio.sleep(WIFI_CHECK_INTERVAL)
+        try:
+            if not wifi_sup.check(time.monotonic()):
+                await wifi_sup.connect()      # versucht es unbegrenzt weiter, mit Backoff
+                if eventsub:
+                    eventsub.drop()           # alte WebSocket-Verbindung ist tot -> neu aufbauen
+            # neue Adresse nach Reconnect oder weil DHCP nach dem gezielten Verbinden eine andere vergab
+            ip = str(wifi.radio.ipv4_address)
+            if ip != bound and ip not in ("None", "0.0.0.0"):
+                log.warn("Neue IP %s → Webserver neu binden.", ip, echo=True)
+                server.stop()
+                server.start(ip, port=8080)
+                bound = ip
+        except Exception as e:
+            await task_failed("wifi", e)
 
-        time.sleep(0.005)
+# =========================
+#   Hauptprogramm
+# =========================
+async def main():
+    global eventsub, twitch_net, fleet
+
+    mark_boot("main")
+    # 1) Letzten Stand sofort zeigen, noch vor dem WLAN
+    restored = restore_state()
+    led = asyncio.create_task(led_task())
+    if restored:
+        animator.play(letters_effect(restored), interrupt=True)
+    else:
+        animator.play(connecting_effect(), interrupt=True)
+    await asyncio.sleep(0)
+    mark_boot("first_frame")
+    load_token_cache()
+    await wifi_sup.connect()
+    mark_boot("wifi")
 
-# Start
-main()
+    pool = socketpool.SocketPool(wifi.radio)
+    ssl_context = ssl.create_default_context()
+    requests = twitch_net = TwitchConnections(adafruit_requests.Session(pool, ssl_context))
+    eventsub = EventSub(pool, ssl_context)
+    fleet_cfg = config.get("fleet", {})
+    if fleet_cfg.get("enabled"):
+        fleet = Fleet(pool, str(wifi.radio.ipv4_address),
+                      fleet_cfg.get("group", FLEET_GROUP), int(fleet_cfg.get("port", FLEET_PORT)))
+        log.info("Flottenmodus: %s %s %d", fleet.mode, fleet.group, fleet.port)
+
+    # 2) Erste Twitch-Abfrage sofort einplanen; Webserver startet, während sie anläuft
+    server = build_server(pool)
+    twitch = asyncio.create_task(twitch_task(requests, server))
+    server.start(str(wifi.radio.ipv4_address), port=8080)
+    mark_boot("server")
+    log.info("Webserver läuft auf http://%s:8080/", wifi.radio.ipv4_address, echo=True)
+    log.info("Ready to check Twitch status!")
+
+    tasks = [
+        asyncio.create_task(http_task(server)),
+        twitch,
+        led,
+        asyncio.create_task(wifi_task(server)),
+        asyncio.create_task(persist_task()),
+        asyncio.create_task(events_task()),
+        asyncio.create_task(eventsub_task(eventsub, requests)),
+    ]
+    if fleet:
+        tasks.append(asyncio.create_task(fleet_task()))
+    await asyncio.gather(*tasks)
+
+# Start (CircuitPython führt code.py als __main__ aus; sim/bench.py und sim/heap.py laden es nur)
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,6 @@
+# sim – Host-Simulator für code.py (läuft unter CPython auf dem PC, NICHT auf dem Pico W).
+#
+# sim/stubs enthält Ersatzmodule für board, neopixel, neopixel_write, wifi und
+# socketpool. adafruit_requests und adafruit_httpserver laufen unverändert (pip);
+# ihr Verkehr geht über den socketpool-Ersatz an sim/fake_twitch.py, einen lokalen
+# Helix/OAuth-Server. sim/run.py startet das unveränderte code.py damit. Siehe sim/README.md.
@@ -0,0 +1,121 @@
+# Kosten der LED-Effekte: alter Weg (Float-Rechnung je Schritt, pixels.fill) gegen die
+# kompilierten Tabellen aus code.py (Festkomma/Gamma-Tabelle, Renderer).
+#
+#   cd Software
+#   python -m sim.bench
+#   python -m sim.bench --gamma 2.2 --seconds 2
+#
+# code.py wird über die Ersatzmodule geladen (sim.run.load_device), ohne main() zu starten.
+# Gemessen wird nur das Erzeugen der Frames in den Pixelpuffer, ohne Ausgabe an den Strip.
+# pixels.fill() ist auf dem Gerät nativ (C) -> hier als Slice-Zuweisung nachgebildet.
+#
+# CPython-Zahlen; auf dem Pico sind die absoluten Werte viel kleiner. Ergebnis:
+# - Je Frame ist der Tabellenweg NICHT schneller: er setzt fünf Buchstaben einzeln über den
+#   Renderer (Python), der alte Weg einen nativen fill(). Schneller sind nur die Kanalfarben
+#   (fertiger Frame aus dem Cache statt Float-Rechnung je Buchstabe).
+# - Beim Standby-Puls gleicht das Abtasten auf die Bildrate das ungefähr aus: ein Durchlauf
+#   (0,12 s) hat so viele Frames, wie der Strip zeigen kann (bei 60 fps: 7), statt 30.
+# - Gewonnen wird bei der Ausgabe: 50 LEDs × 24 Bit × 1,25 µs = 1,5 ms je Übertragung,
+#   und statt 250 werden nur noch so viele Frames je Sekunde übertragen (berechnet, nicht gemessen).
+import argparse
+import json
+import os
+import time
+
+from sim.run import SOFTWARE, load_device, prepare_workdir
+
+OFFLINE = [50, 50, 50]
+PULS_SECONDS = 0.12           # ein Durchlauf des alten standby_effect() (30 Schritte à 4 ms)
+STRIP_SHOW_MS = 50 * 24 * 1.25 / 1000   # eine Übertragung an 50 LEDs (800 kHz)
+
+
+def native_fill(buf, col):
+    """pixels.fill() (nativ): ein Farbwert für alle 50 Pixel in einem Rutsch (GRB)."""
+    buf[:] = bytes((col[1], col[0], col[2])) * 50
+
+
+def old_puls(buf, steps):
+    """standby_effect() vor den Tabellen: Farbe je Schritt neu in Float, dann pixels.fill()."""
+    base_b = 0.2; pulse = 0.2
+    for s in range(0, steps):
+        b = base_b + pulse * (s / steps)
+        native_fill(buf, [int(c * b) for c in OFFLINE])
+        yield PULS_SECONDS / steps
+
+
+def old_letters(buf, letters, channel_cfg):
+    """set_letter_colors() vor dem Frame-Cache: Farbe*Helligkeit je Buchstabe in Float, pixels[i] = ..."""
+    for letter_key, idxs in letters.items():
+        lc = channel_cfg["letters"].get(letter_key, {})
+        bright = lc.get("brightness", 0.5)
+        adj = [int(c * bright) for c in lc.get("color", [0, 0, 0])]
+        px = bytes((adj[1], adj[0], adj[2]))
+        for i in idxs:
+            buf[i * 3:i * 3 + 3] = px
+    yield 0
+
+
+def rate(make, seconds):
+    """Frames/s: Generator immer wieder neu anlegen und durchlaufen."""
+    frames = 0
+    end = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < end:
+        for _ in make():
+            frames += 1
+    return frames / (time.perf_counter() - start)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Kosten der LED-Effekte, vorher/nachher")
+    ap.add_argument("--seconds", type=float, default=1.0, help="Messdauer je Messung")
+    ap.add_argument("--gamma", type=float, default=1.0, help="Gamma-Tabelle wie config.json \"led\"")
+    args = ap.parse_args()
+
+    with open(os.path.join(SOFTWARE, "config.json")) as f:
+        config = json.load(f)
+    config.setdefault("led", {})["gamma"] = args.gamma
+    dev = load_device(prepare_workdir(config=config))
+    buf = bytearray(150)
+    ch_a, ch_b = dev["config"]["channels"][:2]
+    puls = dev["effect_table"]("puls", None, OFFLINE)
+    puls_full = dev["compile_effect"](dev["DEFAULT_EFFECTS"]["puls"], OFFLINE)   # ohne Abtastung
+    lauflicht = dev["effect_table"]("lauflicht", None, OFFLINE)
+    n_puls = len(puls[0]) // 15
+    n_full = len(puls_full[0]) // 15
+
+    def us(fps):
+        return "%.1f" % (1e6 / fps) if fps else "-"
+
+    # Je Frame, gleiche Frame-Zahl vorher/nachher; Kanalfarben wechseln zwischen zwei Kanälen,
+    # damit jeder Frame wirklich etwas ändert (wie beim Neuzeichnen auf dem Gerät)
+    rows = (
+        ("Standby-Puls", lambda: old_puls(buf, n_puls), lambda: dev["table_effect"](puls)),
+        ("Kanalfarben",
+         lambda: dev["chain"](old_letters(buf, dev["letters"], ch_a), old_letters(buf, dev["letters"], ch_b)),
+         lambda: dev["chain"](dev["letters_effect"](ch_a), dev["letters_effect"](ch_b))),
+        ("Lauflicht", None, lambda: dev["table_effect"](lauflicht)),
+    )
+    print("%-14s %16s %16s" % ("Effekt", "vorher [µs/Frame]", "nachher [µs/Frame]"))
+    for name, old, new in rows:
+        before = rate(old, args.seconds) if old else None
+        after = rate(new, args.seconds)
+        print("%-14s %16s %16s" % (name, us(before), us(after)))
+
+    # CPU-Anteil einer Sekunde, wenn der Puls in seinem eigenen Takt läuft
+    print()
+    print("Standby-Puls, CPU-Anteil (ein Durchlauf = %.2f s):" % PULS_SECONDS)
+    cases = (
+        ("vorher: Float + fill, %d Schritte" % n_full, n_full, lambda: old_puls(buf, n_full)),
+        ("Tabelle, %d Frames (ohne Abtastung)" % n_full, n_full, lambda: dev["table_effect"](puls_full)),
+        ("nachher: Tabelle, %d Frames" % n_puls, n_puls, lambda: dev["table_effect"](puls)),
+    )
+    for name, n, make in cases:
+        fps = rate(make, args.seconds)
+        print("  %-36s %4.0f Frames/s  %6.2f %%" % (name, n / PULS_SECONDS, 100 * (n / PULS_SECONDS) / fps))
+    print("Ausgabe an den Strip (%.1f ms je Frame, berechnet): vorher %.1f %%, nachher %.1f %%" % (
+        STRIP_SHOW_MS, STRIP_SHOW_MS / 10 * n_full / PULS_SECONDS, STRIP_SHOW_MS / 10 * n_puls / PULS_SECONDS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Lokaler Ersatz für wss://eventsub.wss.twitch.tv/ws – nur für den Simulator.
+#
+# Spricht das EventSub-WebSocket-Protokoll im Klartext (TLS simuliert sim/tls.py):
+# session_welcome, session_keepalive, notification, session_reconnect.
+import base64
+import hashlib
+import json
+import select
+import socketserver
+import threading
+import time
+import uuid
+
+_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _frame(text):
+    data = text.encode("utf-8")
+    n = len(data)
+    if n < 126:
+        head = bytes((0x81, n))
+    elif n < 65536:
+        head = bytes((0x81, 126, n >> 8, n & 0xFF))
+    else:
+        head = bytes((0x81, 127)) + n.to_bytes(8, "big")
+    return head + data
+
+
+def _message(message_type, payload, subscription_type=None):
+    meta = {"message_id": str(uuid.uuid4()), "message_type": message_type,
+            "message_timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    if subscription_type:
+        meta["subscription_type"] = subscription_type
+        meta["subscription_version"] = "1"
+    return json.dumps({"metadata": meta, "payload": payload})
+
+
+class _Session:
+    def __init__(self, sock, keepalive):
+        self.id = "sim-" + uuid.uuid4().hex[:12]
+        self.sock = sock
+        self.keepalive = keepalive
+        self.outbox = []
+        self.lock = threading.Lock()
+        self.open = True
+
+    def send(self, text):
+        with self.lock:
+            self.outbox.append(text)
+
+
+class FakeEventSub:
+    def __init__(self, host="127.0.0.1", port=0, keepalive=10):
+        self.keepalive = keepalive
+        self.sessions = {}            # id -> _Session
+        self.subscriptions = []       # (session_id, type, user_id, login)
+        self.lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def subscribe(self, session_id, sub_type, user_id, login):
+        with self.lock:
+            if session_id not in self.sessions:
+                return False
+            entry = (session_id, sub_type, user_id, login)
+            if entry in self.subscriptions:
+                return None           # gibt es schon -> 409 wie bei Twitch
+            self.subscriptions.append(entry)
+            return True
+
+    def notify(self, sub_type, login, user_id):
+        """stream.online/stream.offline an alle passenden Abos schicken. Liefert die Anzahl."""
+        sent = 0
+        with self.lock:
+            targets = [(sid, self.sessions.get(sid)) for sid, t, uid, _ in self.subscriptions
+                       if t == sub_type and uid == user_id]
+        for sid, session in targets:
+            if not session or not session.open:
+                continue
+            event = {"broadcaster_user_id": user_id, "broadcaster_user_login": login,
+                     "broadcaster_user_name": login.capitalize()}
+            if sub_type == "stream.online":
+                event.update({"id": "1", "type": "live", "started_at": "2026-10-18T08:00:00Z"})
+            payload = {"subscription": {"id": str(uuid.uuid4()), "status": "enabled", "type": sub_type,
+                                        "version": "1", "cost": 0,
+                                        "condition": {"broadcaster_user_id": user_id},
+                                        "transport": {"method": "websocket", "session_id": sid}},
+                       "event": event}
+            session.send(_message("notification", payload, sub_type))
+            sent += 1
+        return sent
+
+    def drop_all(self):
+        """Alle Verbindungen hart trennen (Netzwerkausfall simulieren)."""
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for s in sessions:
+            s.open = False
+
+    def _handler(self):
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                sock = self.request
+                head = b""
+                while b"\r\n\r\n" not in head:
+                    chunk = sock.recv(1024)
+                    if not chunk:
+                        return
+                    head += chunk
+                key = ""
+                for line in head.decode("latin-1").split("\r\n"):
+                    if line.lower().startswith("sec-websocket-key:"):
+                        key = line.split(":", 1)[1].strip()
+                accept = base64.b64encode(hashlib.sha1((key + _GUID).encode()).digest()).decode()
+                sock.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                              "Connection: Upgrade\r\nSec-WebSocket-Accept: %s\r\n\r\n" % accept).encode())
+                session = _Session(sock, fake.keepalive)
+                with fake.lock:
+                    fake.sessions[session.id] = session
+                session.send(_message("session_welcome", {"session": {
+                    "id": session.id, "status": "connected", "connected_at": "2026-10-18T08:00:00Z",
+                    "keepalive_timeout_seconds": session.keepalive, "reconnect_url": None}}))
+                last_tx = 0.0
+                try:
+                    while session.open:
+                        with session.lock:
+                            out, session.outbox = session.outbox, []
+                        for text in out:
+                            sock.sendall(_frame(text))
+                            last_tx = time.monotonic()
+                        if time.monotonic() - last_tx > session.keepalive * 0.8:
+                            sock.sendall(_frame(_message("session_keepalive", {})))
+                            last_tx = time.monotonic()
+                        r, _, _ = select.select([sock], [], [], 0.05)
+                        if r:
+                            data = sock.recv(4096)
+                            if not data:
+                                break
+                            if data[0] & 0x0F == 0x8:    # Close-Frame vom Client
+                                break
+                finally:
+                    session.open = False
+                    with fake.lock:
+                        fake.sessions.pop(session.id, None)
+                        fake.subscriptions = [s for s in fake.subscriptions if s[0] != session.id]
+
+        return Handler
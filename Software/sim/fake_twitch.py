@@ -0,0 +1,251 @@
+# Lokaler Ersatz für id.twitch.tv (OAuth) und api.twitch.tv (Helix) – nur für den Simulator.
+#
+# Skriptbar aus Python (FakeTwitch-Attribute) oder per HTTP:
+#   POST /_sim  {"live": ["ehajo"], "latency": 0.3, "fail": [401, 429], "rotate_token": true}
+#   GET  /_sim  -> aktueller Zustand + Request-Log-Zähler
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def user_id(login):
+    """Stabile, zum Login passende User-ID."""
+    return str(10000000 + zlib.crc32(login.lower().encode()) % 90000000)
+
+
+def stream_object(login, index):
+    """Ein Helix-Stream-Eintrag mit allen Feldern, die Twitch auch liefert."""
+    return {
+        "id": str(40000000000 + index),
+        "user_id": user_id(login),
+        "user_login": login,
+        "user_name": login.capitalize(),
+        "game_id": "509670",
+        "game_name": "Science & Technology",
+        "type": "live",
+        "title": "Live aus der Werkstatt – Löten, Platinen, Fragen & Antworten #%d" % index,
+        "tags": ["Deutsch", "Elektronik", "Maker", "DIY", "Löten"],
+        "viewer_count": 123 + index,
+        "started_at": "2026-10-18T08:00:00Z",
+        "language": "de",
+        "thumbnail_url": "https://static-cdn.jtvnw.net/previews-ttv/live_user_%s-{width}x{height}.jpg" % login,
+        "tag_ids": [],
+        "is_mature": False,
+    }
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass                          # Verbindungsabbrüche des Geräts sind hier normal
+
+
+class FakeTwitch:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.live = set()             # Logins, die gerade live sind
+        self.latency = 0.0            # Verzögerung je Antwort (Sekunden)
+        self.fail = []                # erzwungene Statuscodes für die nächsten Helix-Requests
+        self.token = "simtoken-1"
+        self.user_token = "simusertoken"  # User-Access-Token für EventSub
+        self.eventsub = None          # FakeEventSub: bekommt Live-Wechsel als Notification
+        self.token_expires_in = 5184000
+        self.idle_close = None        # Sekunden: Keep-Alive-Verbindungen im Leerlauf schließen
+        self.ratelimit_limit = 800
+        self.ratelimit_remaining = 800
+        self.ratelimit_window = 60
+        self._ratelimit_reset = time.time() + self.ratelimit_window
+        self.log = []                 # (zeit, methode, pfad, status)
+        self.lock = threading.Lock()
+        self.httpd = _QuietHTTPServer((host, port), self._handler())
+        self.address = self.httpd.server_address
+        self._thread = None
+
+    # ---- Steuerung ----
+    def set_live(self, *logins):
+        self._change_live(set(n.lower() for n in logins))
+
+    def _change_live(self, live):
+        with self.lock:
+            before, self.live = self.live, live
+        if self.eventsub:
+            for login in sorted(live - before):
+                self.eventsub.notify("stream.online", login, user_id(login))
+            for login in sorted(before - live):
+                self.eventsub.notify("stream.offline", login, user_id(login))
+
+    def rotate_token(self):
+        """Altes Token ungültig machen -> nächster Helix-Call bekommt 401."""
+        with self.lock:
+            n = int(self.token.rsplit("-", 1)[1]) + 1
+            self.token = "simtoken-%d" % n
+
+    def count(self, path_prefix, status=None):
+        with self.lock:
+            return sum(1 for e in self.log if e[2].startswith(path_prefix) and (status is None or e[3] == status))
+
+    def state(self):
+        with self.lock:
+            return {"live": sorted(self.live), "latency": self.latency, "fail": list(self.fail),
+                    "token": self.token, "requests": len(self.log),
+                    "helix": sum(1 for e in self.log if e[2].startswith("/helix/")),
+                    "oauth": sum(1 for e in self.log if e[2].startswith("/oauth2/")),
+                    "eventsub": len(self.eventsub.subscriptions) if self.eventsub else None}
+
+    def apply(self, cmd):
+        if "live" in cmd:
+            self._change_live(set(n.lower() for n in cmd["live"]))
+        with self.lock:
+            if "latency" in cmd:
+                self.latency = float(cmd["latency"])
+            if "fail" in cmd:
+                self.fail = list(cmd["fail"])
+        if cmd.get("rotate_token"):
+            self.rotate_token()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # ---- Ratelimit-Bucket wie bei Helix (Punkte pro Minute) ----
+    def _take_point(self):
+        now = time.time()
+        if now >= self._ratelimit_reset:
+            self.ratelimit_remaining = self.ratelimit_limit
+            self._ratelimit_reset = now + self.ratelimit_window
+        if self.ratelimit_remaining <= 0:
+            return False
+        self.ratelimit_remaining -= 1
+        return True
+
+    def _ratelimit_headers(self):
+        return {
+            "Ratelimit-Limit": str(self.ratelimit_limit),
+            "Ratelimit-Remaining": str(self.ratelimit_remaining),
+            "Ratelimit-Reset": str(int(self._ratelimit_reset)),
+        }
+
+    # ---- HTTP ----
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"     # Keep-Alive wie bei Twitch
+
+            def setup(self):
+                self.timeout = fake.idle_close    # Leerlauf-Timeout -> Verbindung zu
+                super().setup()
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8") if not isinstance(body, bytes) else body
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+                with fake.lock:
+                    fake.log.append((time.monotonic(), self.command, self.path, status))
+
+            def _body(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(n) if n else b""
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == "/_sim":
+                    return self._send(200, fake.state())
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if url.path.startswith("/helix/"):
+                    return self._helix(url)
+                return self._send(404, {"error": "Not Found", "status": 404})
+
+            def do_POST(self):
+                url = urlsplit(self.path)
+                body = self._body()
+                if url.path == "/_sim":
+                    fake.apply(json.loads(body or b"{}"))
+                    return self._send(200, fake.state())
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if url.path == "/oauth2/token":
+                    return self._send(200, {"access_token": fake.token,
+                                            "expires_in": fake.token_expires_in,
+                                            "token_type": "bearer"})
+                if url.path.startswith("/helix/"):
+                    return self._helix(url, body)
+                return self._send(404, {"error": "Not Found", "status": 404})
+
+            def _helix(self, url, body=b""):
+                with fake.lock:
+                    forced = fake.fail.pop(0) if fake.fail else None
+                    allowed = fake._take_point()
+                    rl = fake._ratelimit_headers()
+                    token = fake.token
+                    live = set(fake.live)
+                auth = self.headers.get("Authorization")
+                if forced == 401 or auth not in ("Bearer " + token, "Bearer " + fake.user_token):
+                    return self._send(401, {"error": "Unauthorized", "status": 401,
+                                            "message": "Invalid OAuth token"}, rl)
+                if forced == 429 or not allowed:
+                    return self._send(429, {"error": "Too Many Requests", "status": 429}, rl)
+                if forced:
+                    return self._send(forced, {"error": "Simulated", "status": forced}, rl)
+                return self._helix_route(url, body, live, rl)
+
+            def _helix_route(self, url, body, live, rl):
+                q = parse_qs(url.query)
+                if url.path == "/helix/streams":
+                    logins = [n.lower() for n in q.get("user_login", [])]
+                    data = [stream_object(n, i) for i, n in enumerate(logins) if n in live]
+                    return self._send(200, {"data": data, "pagination": {}}, rl)
+                if url.path == "/helix/users":
+                    data = [{"id": user_id(n), "login": n.lower(), "display_name": n,
+                             "type": "", "broadcaster_type": "partner", "description": "",
+                             "profile_image_url": "", "offline_image_url": "", "view_count": 0,
+                             "created_at": "2016-01-01T00:00:00Z"} for n in q.get("login", [])]
+                    return self._send(200, {"data": data}, rl)
+                if url.path == "/helix/eventsub/subscriptions":
+                    return self._subscribe(json.loads(body or b"{}"), rl)
+                return self._send(404, {"error": "Not Found", "status": 404}, rl)
+
+            def _subscribe(self, sub, rl):
+                if self.headers.get("Authorization") != "Bearer " + fake.user_token:
+                    return self._send(401, {"error": "Unauthorized", "status": 401}, rl)
+                session_id = sub.get("transport", {}).get("session_id")
+                uid = sub.get("condition", {}).get("broadcaster_user_id")
+                login = next((n for n in fake.known_logins() if user_id(n) == uid), "")
+                ok = fake.eventsub.subscribe(session_id, sub.get("type"), uid, login) if fake.eventsub else False
+                if ok is None:
+                    return self._send(409, {"error": "Conflict", "status": 409,
+                                            "message": "subscription already exists"}, rl)
+                if not ok:
+                    return self._send(400, {"error": "Bad Request", "status": 400,
+                                            "message": "websocket transport session does not exist"}, rl)
+                sub.update({"id": "sub-%s-%s" % (uid, sub.get("type")), "status": "enabled", "cost": 0})
+                return self._send(202, {"data": [sub], "total": 1, "total_cost": 0,
+                                        "max_total_cost": 10}, rl)
+
+        return Handler
+
+    def known_logins(self):
+        """Alle Logins, nach denen das Gerät bisher gefragt hat (für User-ID -> Login)."""
+        with self.lock:
+            paths = [e[2] for e in self.log if e[2].startswith("/helix/users")]
+        logins = set()
+        for p in paths:
+            logins.update(n.lower() for n in parse_qs(urlsplit(p).query).get("login", []))
+        return logins
@@ -0,0 +1,128 @@
+# Flottenmodus mit mehreren simulierten Schildern auf Loopback (127.0.0.2, .3, ...).
+#
+#   cd Software
+#   python -m sim.fleet --nodes 3 --duration 60 --kill-leader 25 --live ehajo
+#   python -m sim.fleet --nodes 2 --duration 40 --channels 100 --live kanal090
+#   python -m sim.fleet --nodes 2 --duration 30 --kill-leader 14 --channels 200 --login-len 25 --live-all --lan-ip
+#   python -m sim.fleet --nodes 3 --duration 70 --kill-leader 15 --rejoin 35
+#
+# Jeder Knoten ist ein eigener sim.run-Prozess mit eigener IP und eigenem Fake-Twitch.
+# Geprüft wird: Vor dem Ausfall fragt nur der Leader Twitch, alle Knoten zeigen denselben
+# Live-Zustand; nach dem Ausfall übernimmt ein Follower. Exit-Code 1, wenn nicht.
+import argparse
+import json
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+LAN_IPS = False                   # --lan-ip: so lang wie 192.168.178.100 (Frame-Größe)
+
+
+def node_ip(i):
+    return ("127.100.100.%d" % (100 + i)) if LAN_IPS else ("127.0.0.%d" % (2 + i))
+
+
+def get(ip, path):
+    try:
+        with urllib.request.urlopen("http://%s:8080%s" % (ip, path), timeout=2) as r:
+            return json.loads(r.read())
+    except Exception:
+        return None
+
+
+def snapshot(ip):
+    """(Leader, Helix-Anfragen, Live-Menge, verworfene Frames) eines Knotens oder None."""
+    cfg = get(ip, "/config")
+    sched = get(ip, "/schedule")
+    if not cfg or not sched or not cfg.get("fleet"):
+        return None
+    net = (cfg.get("net") or {}).get("api.twitch.tv") or {}
+    live = sorted(c["name"] for c in sched["channels"] if c.get("live"))
+    return cfg["fleet"]["leader"], net.get("requests", 0), live, cfg["fleet"].get("oversize", 0)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="ON AIR Flottenmodus-Test")
+    ap.add_argument("--nodes", type=int, default=3)
+    ap.add_argument("--duration", type=float, default=60.0)
+    ap.add_argument("--kill-leader", type=float, help="Leader (kleinste IP) nach N Sekunden beenden")
+    ap.add_argument("--live", nargs="*", default=["ehajo"])
+    ap.add_argument("--channels", type=int, help="Kanalliste auf N Kanäle auffüllen (Zustand in mehreren Frames)")
+    ap.add_argument("--login-len", type=int, help="Logins der Zusatzkanäle so lang machen (max. 25)")
+    ap.add_argument("--live-all", action="store_true", help="alle Kanäle sind live (größte Frames)")
+    ap.add_argument("--rejoin", type=float,
+                    help="den beendeten Leader nach N Sekunden neu starten; er darf nicht wieder übernehmen")
+    ap.add_argument("--lan-ip", action="store_true", help="Knoten-IPs so lang wie im Heimnetz (127.100.100.100, ...)")
+    args = ap.parse_args(argv)
+    global LAN_IPS
+    LAN_IPS = args.lan_ip
+
+    def start(i, duration):
+        cmd = [sys.executable, "-m", "sim.run", "--fleet", "--ip", node_ip(i),
+               "--duration", str(duration), "--live"] + args.live
+        if args.channels:
+            cmd += ["--channels", str(args.channels)]
+        if args.login_len:
+            cmd += ["--login-len", str(args.login_len)]
+        if args.live_all:
+            cmd.append("--live-all")
+        procs.append(subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True))
+
+    procs = []
+    for i in range(args.nodes):
+        start(i, args.kill_leader if (i == 0 and args.kill_leader) else args.duration)
+
+    ok = True
+    t0 = time.monotonic()
+    before_kill = None
+    takeover = None
+    rejoined = None               # letzter Stand, während der neu gestartete Knoten läuft
+    restarted = False
+    while time.monotonic() - t0 < args.duration:
+        time.sleep(2)
+        t = time.monotonic() - t0
+        if args.rejoin and not restarted and t >= args.rejoin:
+            restarted = True
+            print("[%5.1fs] %s startet neu" % (t, node_ip(0)))
+            start(0, args.duration - t)
+        snaps = {node_ip(i): snapshot(node_ip(i)) for i in range(args.nodes)}
+        print("[%5.1fs] %s" % (t, "  ".join("%s:%s" % (ip, s and "L=%s helix=%d live=%d oversize=%d" % (
+            s[0], s[1], len(s[2]), s[3])) for ip, s in snaps.items())))
+        if args.kill_leader and t < args.kill_leader - 1:
+            before_kill = snaps
+        # erst zählen, wenn der alte Leader wirklich weg ist (sein Prozess endet nicht sofort)
+        if args.kill_leader and t > args.kill_leader and takeover is None and snaps[node_ip(0)] is None:
+            leaders = set(s[0] for s in snaps.values() if s)
+            if leaders and leaders <= {ip for ip, s in snaps.items() if s}:
+                takeover = t - args.kill_leader
+        # Zuhörphase des neu gestarteten Knotens abwarten, Prozesse enden kurz vor args.duration
+        if restarted and args.rejoin + 10 < t < args.duration - 2 and snaps[node_ip(0)]:
+            rejoined = snaps
+
+    for p in procs:
+        p.wait()
+
+    if before_kill:
+        pollers = [ip for ip, s in before_kill.items() if s and s[1] > 0]
+        lives = set(tuple(s[2]) for s in before_kill.values() if s)
+        print("Vor dem Ausfall: Twitch-Abfragen von", pollers, "| Live-Zustände:",
+              ", ".join(("%d live" % len(l)) if len(l) > 5 else str(list(l)) for l in lives))
+        oversize = sum(s[3] for s in before_kill.values() if s)
+        print("Verworfene Frames (zu groß):", oversize)
+        ok &= len(pollers) == 1 and len(lives) == 1 and oversize == 0
+    if args.kill_leader:
+        print("Übernahme nach dem Ausfall:", "%.1f s" % takeover if takeover is not None else "nie")
+        ok &= takeover is not None
+    if args.rejoin:
+        leaders = set(s[0] for s in rejoined.values() if s) if rejoined else set()
+        print("Nach dem Neustart von %s: Leader %s, dessen Twitch-Abfragen: %s" % (
+            node_ip(0), sorted(leaders), rejoined[node_ip(0)][1] if rejoined else "-"))
+        ok &= len(leaders) == 1 and node_ip(0) not in leaders and rejoined[node_ip(0)][1] == 0
+    print("OK" if ok else "FEHLER")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Heap-Spitze beim Lesen einer /helix/streams-Antwort: r.json() gegen den Scanner aus code.py.
+#
+#   cd Software
+#   python -m sim.heap
+#
+# Beide Wege lesen dieselbe Antwort über adafruit_requests.Response von einem Ersatz-Socket.
+# Gemessen wird mit tracemalloc (CPython); auf dem Pico sind die absoluten Zahlen kleiner,
+# das Verhältnis bleibt. Zusätzlich wird geprüft, dass beide dieselben Logins liefern –
+# auch bei Chunked-Encoding und 1-Byte-Häppchen. Exit-Code 1 bei Abweichung.
+import io
+import json
+import sys
+import tracemalloc
+
+from adafruit_requests import Response
+
+from sim.fake_twitch import stream_object
+from sim.run import load_device, prepare_workdir
+
+
+class FakeSocket:
+    def __init__(self, data, segment):
+        self._io = io.BytesIO(data)
+        self._segment = segment
+
+    def recv_into(self, buf, size=0):
+        size = min(size or len(buf), len(buf), self._segment)
+        chunk = self._io.read(size)
+        buf[:len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self):
+        pass
+
+
+def http_response(body, chunked=False):
+    if not chunked:
+        head = "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % len(body)
+        return head.encode() + body
+    parts = [body[i:i + 500] for i in range(0, len(body), 500)]
+    data = b"".join(b"%x\r\n%s\r\n" % (len(p), p) for p in parts) + b"0\r\n\r\n"
+    return b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n" + data
+
+
+def helix_body(n_live):
+    data = [stream_object("kanal%02d" % i, i) for i in range(n_live)]
+    if data:
+        data[0]["title"] = 'Titel mit \\"Escapes\\" und "user_login": "falle"'
+    return json.dumps({"data": data, "pagination": {"cursor": "eyJiIjpudWxsfQ"}}).encode()
+
+
+def via_json(r):
+    d = r.json()
+    return set(s.get("user_login", "").lower() for s in d.get("data", []))
+
+
+def measure(fn, raw, segment=1460):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    r = Response(FakeSocket(raw, segment), None, "GET")
+    result = fn(r)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return result, peak
+
+
+def main():
+    # code.py über die Ersatzmodule laden, ohne main() zu starten
+    scan = load_device(prepare_workdir())["scan_live_logins"]
+    measure(scan, http_response(helix_body(0)))   # Histogramm von @timed vorab anlegen
+    ok = True
+    print("%6s %9s %12s %12s" % ("live", "Body", "r.json()", "Scanner"))
+    for n in (0, 1, 10, 100):
+        body = helix_body(n)
+        raw = http_response(body)
+        want, peak_json = measure(via_json, raw)
+        got, peak_scan = measure(scan, raw)
+        print("%6d %8dB %11dB %11dB" % (n, len(body), peak_json, peak_scan))
+        for chunked in (False, True):
+            for segment in (1, 7, 1460):
+                got_x, _ = measure(scan, http_response(body, chunked), segment)
+                ok &= got_x == want
+        ok &= got == want == set("kanal%02d" % i for i in range(n))
+    print("OK" if ok else "FEHLER: Scanner liefert andere Logins als r.json()")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
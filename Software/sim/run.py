@@ -0,0 +1,267 @@
+# Startet das unveränderte code.py unter CPython mit den Ersatzmodulen aus sim/stubs.
+#
+#   cd Software
+#   python -m sim.run --duration 30 --live ehajo --latency 0.2 --frames frames.json
+#
+# Voraussetzung am PC: pip install adafruit-circuitpython-httpserver \
+#   adafruit-circuitpython-requests adafruit-circuitpython-connectionmanager
+# (reine Python-Bibliotheken, laufen auf CPython unverändert).
+import argparse
+import json
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+SOFTWARE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(SOFTWARE, "sim", "stubs")
+DEVICE_FILES = ("code.py", "config.json", "www")
+
+SIM_SECRETS = {
+    "wifi": {"ssid": "sim-ssid", "password": "sim-pw"},
+    "twitch": {"client_id": "sim-client", "client_secret": "sim-secret"},
+}
+SIM_USER_TOKEN = "simusertoken"
+
+
+def sim_login(i, length=None):
+    """Login des i-ten Zusatzkanals: kanal003, ... – mit length auf so viele Zeichen aufgefüllt."""
+    name = "kanal%03d" % i
+    return (name + "x" * 25)[:max(len(name), length)] if length else name
+
+
+def prepare_workdir(workdir=None, config=None, push=False, fleet=False, channels=None, login_len=None):
+    """Legt ein "CIRCUITPY-Laufwerk" an: code.py, config.json, www/ und Sim-secrets.json."""
+    workdir = workdir or tempfile.mkdtemp(prefix="onair-sim-")
+    os.makedirs(workdir, exist_ok=True)
+    for name in DEVICE_FILES:
+        src = os.path.join(SOFTWARE, name)
+        dst = os.path.join(workdir, name)
+        if os.path.isdir(src):
+            shutil.rmtree(dst, ignore_errors=True)
+            shutil.copytree(src, dst)
+        elif not os.path.exists(dst) or name == "code.py":
+            shutil.copy(src, dst)
+    if (fleet or channels) and config is None:
+        with open(os.path.join(workdir, "config.json")) as f:
+            config = json.load(f)
+    if fleet:
+        config["fleet"] = {"enabled": True}
+    if channels:
+        # Kanalliste auf N Einträge auffüllen (kanal000, kanal001, ...), Farben vom ersten Kanal
+        template = config["channels"][0]
+        while len(config["channels"]) < channels:
+            ch = json.loads(json.dumps(template))
+            ch["name"] = sim_login(len(config["channels"]), login_len)
+            config["channels"].append(ch)
+    if config is not None:
+        with open(os.path.join(workdir, "config.json"), "w") as f:
+            json.dump(config, f)
+    secrets = json.loads(json.dumps(SIM_SECRETS))
+    if push:
+        secrets["twitch"]["access_token"] = SIM_USER_TOKEN
+    with open(os.path.join(workdir, "secrets.json"), "w") as f:
+        json.dump(secrets, f)
+    return workdir
+
+
+def install_stubs(fake_address, ip="127.0.0.1", eventsub_address=None):
+    """Ersatzmodule vor alle anderen stellen und Twitch-Hosts auf den Fake-Server umleiten."""
+    if STUBS not in sys.path:
+        sys.path.insert(0, STUBS)
+    for name in ("board", "neopixel", "neopixel_write", "wifi", "socketpool"):
+        sys.modules.pop(name, None)
+    import socketpool
+    import wifi
+
+    from sim import tls
+
+    socketpool.HOST_MAP[("id.twitch.tv", 443)] = fake_address
+    socketpool.HOST_MAP[("api.twitch.tv", 443)] = fake_address
+    if eventsub_address:
+        socketpool.HOST_MAP[("eventsub.wss.twitch.tv", 443)] = eventsub_address
+    wifi.radio.ipv4_address = ip
+    tls.install()
+    return wifi.radio
+
+
+def start_device(workdir):
+    """code.py in einem Daemon-Thread starten (wie nach dem Einschalten)."""
+    def _run():
+        os.chdir(workdir)
+        try:
+            runpy.run_path(os.path.join(workdir, "code.py"), run_name="__main__")
+        except BaseException as e:    # Absturz sichtbar machen, Simulator läuft weiter
+            print("code.py beendet:", repr(e))
+
+    t = threading.Thread(target=_run, daemon=True, name="code.py")
+    t.start()
+    return t
+
+
+def load_device(workdir):
+    """code.py laden, ohne main() zu starten, und seinen Namensraum liefern (Messungen an einzelnen Funktionen).
+
+    Kein Fake-Server: Twitch ist nicht erreichbar, es wird auch nichts abgefragt.
+    """
+    install_stubs(None)
+    os.chdir(workdir)
+    return runpy.run_path(os.path.join(workdir, "code.py"), run_name="device")
+
+
+def probe(url, timeout=5.0):
+    """Ein GET gegen den Webserver des Geräts; liefert die Latenz in Sekunden (oder None)."""
+    start = time.monotonic()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            r.read()
+    except Exception:
+        return None
+    return time.monotonic() - start
+
+
+def device_live(ip):
+    """(live, alle) Kanäle, wie das Gerät sie gerade sieht (aus GET /schedule), oder None."""
+    try:
+        with urllib.request.urlopen("http://%s:8080/schedule" % ip, timeout=5) as r:
+            data = json.loads(r.read())
+    except Exception:
+        return None
+    channels = data.get("channels", [])
+    return set(c["name"] for c in channels if c.get("live")), set(c["name"] for c in channels)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(argv=None):
+    from sim import strip
+    from sim.fake_eventsub import FakeEventSub
+    from sim.fake_twitch import FakeTwitch
+
+    ap = argparse.ArgumentParser(description="ON AIR Host-Simulator")
+    ap.add_argument("--duration", type=float, default=30.0, help="Laufzeit in Sekunden")
+    ap.add_argument("--live", nargs="*", default=[], help="Logins, die live sind")
+    ap.add_argument("--latency", type=float, default=0.0, help="Antwortzeit des Fake-Twitch (s)")
+    ap.add_argument("--fail", nargs="*", type=int, default=[], help="erzwungene Status (401/429) für die nächsten Helix-Requests")
+    ap.add_argument("--idle-close", type=float, help="Fake-Twitch schließt Keep-Alive-Verbindungen nach N s Leerlauf")
+    ap.add_argument("--ip", default="127.0.0.1", help="IP des simulierten Geräts (127.0.0.x)")
+    ap.add_argument("--workdir", help="Arbeitsverzeichnis (Standard: temporär)")
+    ap.add_argument("--frames", help="aufgezeichnete Frames als JSON hierhin schreiben")
+    ap.add_argument("--probe", type=float, default=0.0, help="Web-Latenz alle N Sekunden messen")
+    ap.add_argument("--push", action="store_true", help="EventSub-Push-Modus (User-Token + Fake-WebSocket)")
+    ap.add_argument("--script", nargs="*", default=[], metavar="T:LOGIN,...",
+                    help="Live-Wechsel nach T Sekunden, z. B. 20:ehajo 40:")
+    ap.add_argument("--channels", type=int, help="Kanalliste auf N Kanäle auffüllen (kanal003, kanal004, ...)")
+    ap.add_argument("--login-len", type=int, help="Logins der Zusatzkanäle auf so viele Zeichen auffüllen (max. 25)")
+    ap.add_argument("--live-all", action="store_true", help="alle Kanäle aus config.json sind live")
+    ap.add_argument("--fleet", action="store_true", help="Flottenmodus einschalten (mehrere Knoten: je ein Lauf mit eigener --ip)")
+    ap.add_argument("--max-stale", type=float,
+                    help="Exit-Code 1, wenn ein Live-Wechsel aus --script länger braucht, bis das Gerät ihn kennt")
+    ap.add_argument("--max-latency", type=float,
+                    help="Exit-Code 1, wenn eine --probe-Messung länger dauert (oder keine gelingt)")
+    ap.add_argument("--wifi-delay", type=float, default=0.0,
+                    help="Dauer eines vollen WLAN-Verbindungsaufbaus (gezielt: ein Drittel)")
+    ap.add_argument("--wifi-fail", type=int, default=0, help="so viele WLAN-Verbindungsversuche schlagen fehl")
+    ap.add_argument("--wifi-drop", nargs="*", type=float, default=[], metavar="T",
+                    help="WLAN nach T Sekunden trennen (Radio meldet getrennt)")
+    ap.add_argument("--wifi-stall", nargs="*", type=float, default=[], metavar="T",
+                    help="Funkloch nach T Sekunden: Radio bleibt verbunden, Gateway antwortet nicht")
+    args = ap.parse_args(argv)
+
+    fake = FakeTwitch().start()
+    fake.set_live(*args.live)
+    fake.latency = args.latency
+    fake.fail = list(args.fail)
+    fake.idle_close = args.idle_close
+    if args.push:
+        fake.eventsub = FakeEventSub().start()
+    radio = install_stubs(fake.address, args.ip, fake.eventsub.address if fake.eventsub else None)
+    radio.connect_delay = args.wifi_delay
+    radio.fail_connects = args.wifi_fail
+    wifi_events = sorted([(t, "drop") for t in args.wifi_drop] + [(t, "stall") for t in args.wifi_stall])
+    workdir = prepare_workdir(args.workdir, push=args.push, fleet=args.fleet, channels=args.channels,
+                              login_len=args.login_len)
+    if args.live_all:
+        with open(os.path.join(workdir, "config.json")) as f:
+            fake.set_live(*[ch["name"] for ch in json.load(f)["channels"]])
+    print("Fake-Twitch auf %s:%d, Arbeitsverzeichnis %s" % (fake.address + (workdir,)))
+
+    start_device(workdir)
+    url = "http://%s:8080/config" % args.ip
+    latencies = []
+    t_start = time.monotonic()
+    end = t_start + args.duration
+    script = sorted((float(t), [n for n in logins.split(",") if n])
+                    for t, logins in (item.split(":", 1) for item in args.script))
+    pending = None                # (zeitpunkt, erwartete Live-Menge) des letzten Wechsels
+    stale = []                    # Sekunden vom Wechsel bis das Gerät ihn kennt (None = nie)
+    while time.monotonic() < end:
+        while wifi_events and time.monotonic() - t_start >= wifi_events[0][0]:
+            t, kind = wifi_events.pop(0)
+            print("[sim %.1fs] WLAN: %s" % (time.monotonic() - t_start, kind))
+            if kind == "drop":
+                radio.disconnect()
+            else:
+                radio.reachable = False
+        while script and time.monotonic() - t_start >= script[0][0]:
+            t, logins = script.pop(0)
+            print("[sim %.1fs] live = %s" % (time.monotonic() - t_start, logins))
+            if pending:
+                stale.append(None)
+            fake.set_live(*logins)
+            pending = (time.monotonic(), set(n.lower() for n in logins))
+        if pending:
+            seen = device_live(args.ip)
+            if seen is not None and seen[0] == pending[1] & seen[1]:
+                stale.append(time.monotonic() - pending[0])
+                print("[sim %.1fs] Gerät kennt den Wechsel nach %.1f s" % (time.monotonic() - t_start, stale[-1]))
+                pending = None
+        if args.probe:
+            lat = probe(url)
+            if lat is not None:
+                latencies.append(lat)
+            time.sleep(args.probe)
+        else:
+            time.sleep(0.2)
+
+    frames = strip.snapshot()
+    span = (frames[-1][0] - frames[0][0]) if len(frames) > 1 else 0
+    print("Frames: %d (%.1f/s)" % (strip.count, (len(frames) / span) if span else 0))
+    print("Fake-Twitch:", json.dumps(fake.state()))
+    from sim import tls
+    print("TLS-Handshakes:", tls.SimSSLContext.handshakes)
+    print("WLAN-Verbindungsaufbauten:", radio.connects, "– DHCP gestartet:", radio.dhcp_starts)
+    if latencies:
+        print("Web-Latenz: n=%d p50=%.1f ms p95=%.1f ms max=%.1f ms" % (
+            len(latencies), percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.95) * 1000, max(latencies) * 1000))
+    if pending:
+        stale.append(None)
+    if stale:
+        print("Live-Wechsel bis zum Gerät:", ", ".join("%.1f s" % v if v is not None else "nie" for v in stale))
+    if args.max_stale is not None and any(v is None or v > args.max_stale for v in stale):
+        print("FEHLER: Wechsel nicht innerhalb von %.0f s beim Gerät angekommen." % args.max_stale)
+        exit_code = 1
+    else:
+        exit_code = 0
+    if args.max_latency is not None and (not latencies or max(latencies) > args.max_latency):
+        print("FEHLER: Web-Latenz über %.2f s." % args.max_latency)
+        exit_code = 1
+    if args.frames:
+        with open(args.frames, "w") as f:
+            json.dump([[round(ts - strip.t0, 4), fr.hex()] for ts, fr in frames], f)
+    sys.stdout.flush()
+    os._exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
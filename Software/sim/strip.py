@@ -0,0 +1,46 @@
+# Virtueller LED-Strip: zeichnet jeden übertragenen Frame mit Zeitstempel auf.
+import threading
+import time
+from collections import deque
+
+MAX_FRAMES = 20000            # ältere Frames werden verworfen (Zähler laufen weiter)
+
+_lock = threading.Lock()
+frames = deque(maxlen=MAX_FRAMES)   # (monotonic, bytes)
+count = 0
+t0 = time.monotonic()
+
+
+def record(pin, buf):
+    global count
+    with _lock:
+        frames.append((time.monotonic(), bytes(buf)))
+        count += 1
+
+
+def last_frame():
+    with _lock:
+        return frames[-1] if frames else (None, b"")
+
+
+def snapshot():
+    with _lock:
+        return list(frames)
+
+
+def pixel(frame, index, byteorder="GRB"):
+    """(r, g, b) eines Pixels aus einem aufgezeichneten Frame."""
+    bpp = len(byteorder)
+    o = index * bpp
+    return tuple(frame[o + byteorder.index(c)] for c in "RGB")
+
+
+def wait_for(predicate, timeout=10.0, poll=0.02):
+    """Wartet, bis predicate(frame) für den letzten Frame wahr ist. Liefert die Wartezeit oder None."""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        ts, frame = last_frame()
+        if ts is not None and predicate(frame):
+            return time.monotonic() - start
+        time.sleep(poll)
+    return None
@@ -0,0 +1,3 @@
+# Ersatz für das CircuitPython-Modul board: Pins sind nur Namen.
+GP2 = "GP2"
+GP15 = "GP15"
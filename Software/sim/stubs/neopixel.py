@@ -0,0 +1,63 @@
+# Ersatz für neopixel.NeoPixel mit der Pixelbuf-API, die code.py benutzt.
+import neopixel_write
+
+RGB = "RGB"
+GRB = "GRB"
+RGBW = "RGBW"
+GRBW = "GRBW"
+
+
+class _Pin:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "<Pin %s>" % self.name
+
+
+class NeoPixel:
+    def __init__(self, pin, n, *, bpp=3, brightness=1.0, auto_write=True, pixel_order=None):
+        self.pin = _Pin(pin)
+        self.n = n
+        self.byteorder = pixel_order or (GRB if bpp == 3 else GRBW)
+        self.bpp = len(self.byteorder)
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self._pixels = [(0, 0, 0)] * n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        return self._pixels[index]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self._pixels[index] = [self._parse(v) for v in value]
+        else:
+            self._pixels[index] = self._parse(value)
+        if self.auto_write:
+            self.show()
+
+    @staticmethod
+    def _parse(value):
+        if isinstance(value, int):
+            return ((value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF)
+        return (int(value[0]), int(value[1]), int(value[2]))
+
+    def fill(self, color):
+        self._pixels = [self._parse(color)] * self.n
+        if self.auto_write:
+            self.show()
+
+    def show(self):
+        buf = bytearray(self.n * self.bpp)
+        offsets = [self.byteorder.index(c) for c in "RGB"]
+        for i, px in enumerate(self._pixels):
+            o = i * self.bpp
+            for k in range(3):
+                buf[o + offsets[k]] = int(px[k] * self.brightness)
+        neopixel_write.neopixel_write(self.pin, buf)
+
+    def deinit(self):
+        pass
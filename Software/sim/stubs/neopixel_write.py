@@ -0,0 +1,6 @@
+# Ersatz für neopixel_write: jede Ausgabe landet als Frame im virtuellen Strip.
+from sim import strip
+
+
+def neopixel_write(pin, buf):
+    strip.record(pin, buf)
@@ -0,0 +1,36 @@
+# Ersatz für socketpool: reicht alles an das socket-Modul von CPython durch.
+# HOST_MAP leitet Twitch-Hostnamen auf die lokalen Fake-Server um (sim.run füllt ihn).
+import socket as _socket
+
+HOST_MAP = {}                 # (host, port) -> (lokale_ip, lokaler_port)
+
+
+def resolve(host, port):
+    return HOST_MAP.get((host, port), (host, port))
+
+
+class SocketPool:
+    AF_INET = _socket.AF_INET
+    SOCK_STREAM = _socket.SOCK_STREAM
+    SOCK_DGRAM = _socket.SOCK_DGRAM
+    SOL_SOCKET = _socket.SOL_SOCKET
+    SO_REUSEADDR = _socket.SO_REUSEADDR
+    IPPROTO_IP = _socket.IPPROTO_IP
+    IPPROTO_TCP = _socket.IPPROTO_TCP
+    IPPROTO_UDP = _socket.IPPROTO_UDP
+    IP_MULTICAST_TTL = _socket.IP_MULTICAST_TTL
+    IP_ADD_MEMBERSHIP = getattr(_socket, "IP_ADD_MEMBERSHIP", 35)
+    IP_MULTICAST_IF = getattr(_socket, "IP_MULTICAST_IF", 32)  # nur im Simulator: Loopback als Multicast-Interface
+    TCP_NODELAY = _socket.TCP_NODELAY
+    EAI_NONAME = _socket.EAI_NONAME
+    gaierror = _socket.gaierror
+
+    def __init__(self, radio):
+        self.radio = radio
+
+    def socket(self, family=_socket.AF_INET, type=_socket.SOCK_STREAM, proto=0):
+        return _socket.socket(family, type, proto)
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        host, port = resolve(host, port)
+        return _socket.getaddrinfo(host, port, family, type, proto, flags)
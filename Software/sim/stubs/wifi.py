@@ -0,0 +1,68 @@
+# Ersatz für das CircuitPython-Modul wifi. Über sim.run steuerbar (fail_connects, connect_delay,
+# ipv4_address, disconnect(), reachable).
+import time
+
+
+class _Network:
+    def __init__(self, ssid, bssid, channel, rssi=-50):
+        self.ssid = ssid
+        self.bssid = bssid
+        self.channel = channel
+        self.rssi = rssi
+
+
+class Radio:
+    def __init__(self):
+        self.connected = False
+        self.ipv4_address = "127.0.0.1"
+        self.ipv4_gateway = "127.0.0.1"
+        self.ipv4_subnet = "255.0.0.0"
+        self.ipv4_dns = "127.0.0.1"
+        self.mac_address = bytes([0x28, 0xCD, 0xC1, 0x00, 0x00, 0x01])
+        self.hostname = "onair-sim"
+        self.ap_info = None
+        self.connect_delay = 0.0      # simulierte Dauer eines Verbindungsaufbaus
+        self.fail_connects = 0        # so viele Versuche schlagen fehl
+        self.connects = 0
+        self.dhcp_starts = 0
+        self.bssid = bytes([0x02, 0, 0, 0, 0, 0x01])
+        self.channel = 6
+        self.reachable = True         # False: Funkloch – connected bleibt True, aber ping() scheitert
+
+    def connect(self, ssid, password="", *, channel=0, bssid=None, timeout=None):
+        self.connects += 1
+        if self.connect_delay:
+            # gezielter Reconnect (BSSID + Kanal bekannt) spart den Scan
+            time.sleep(self.connect_delay / (3 if (bssid and channel) else 1))
+        if self.fail_connects > 0:
+            self.fail_connects -= 1
+            raise ConnectionError("No network with that ssid")
+        self.connected = True
+        self.reachable = True
+        self.ap_info = _Network(ssid, self.bssid, self.channel)
+
+    def disconnect(self):
+        self.connected = False
+        self.ap_info = None
+
+    def ping(self, ip, *, timeout=0.5):
+        if self.connected and self.reachable:
+            return 0.002
+        time.sleep(timeout)
+        return None
+
+    def set_ipv4_address(self, *, ipv4, netmask, gateway, ipv4_dns=None):
+        self.ipv4_address = str(ipv4)
+        self.ipv4_subnet = str(netmask)
+        self.ipv4_gateway = str(gateway)
+        if ipv4_dns:
+            self.ipv4_dns = str(ipv4_dns)
+
+    def start_dhcp(self):
+        self.dhcp_starts += 1
+
+    def stop_dhcp(self):
+        pass
+
+
+radio = Radio()
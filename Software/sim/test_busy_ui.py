@@ -0,0 +1,24 @@
+"""Ein Live-Wechsel kommt an, obwohl die Web-UI das Gerät dauernd abfragt.
+
+Die UI fragt fünfmal pro Sekunde /config ab; nach 15 s geht ehajo live. Web hat Vorrang,
+aber Twitch wird höchstens TWITCH_MAX_DEFER_SEC aufgeschoben -> der Wechsel muss innerhalb
+von Intervall (45 s) + 10 s beim Gerät sein (laut GET /schedule, --max-stale).
+
+    cd Software
+    python -m sim.test_busy_ui
+    python -m pytest -p no:debugging sim/test_busy_ui.py   # siehe sim/README.md
+"""
+from sim.test_web_latency import run_sim
+
+ALLOWED = 60           # Intervall + TWITCH_MAX_DEFER_SEC + Reserve
+
+
+def test_live_change_arrives_during_busy_ui():
+    r = run_sim("--duration", "80", "--probe", "0.2", "--script", "15:ehajo", "--max-stale", str(ALLOWED))
+    assert r.returncode == 0, r.stdout[-2000:]
+    assert "Gerät kennt den Wechsel" in r.stdout, r.stdout[-2000:]
+
+
+if __name__ == "__main__":
+    test_live_change_arrives_during_busy_ui()
+    print("ok")
@@ -0,0 +1,35 @@
+"""Web-Latenz bleibt begrenzt, während ein (langsamer) Twitch-Request läuft.
+
+Startet den Simulator als eigenen Prozess – er ersetzt Module global und beendet sich
+mit os._exit() – und prüft dessen Exit-Code (--max-latency).
+
+    cd Software
+    python -m sim.test_web_latency
+    python -m pytest -p no:debugging sim/test_web_latency.py   # siehe sim/README.md
+"""
+import os
+import subprocess
+import sys
+
+SOFTWARE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TWITCH_LATENCY = 1.0   # so lange hängt jeder Helix-Request
+ALLOWED = 1.5          # höchstens ein laufender Request + Rest eines Durchlaufs
+
+
+def run_sim(*args):
+    return subprocess.run([sys.executable, "-m", "sim.run"] + list(args), cwd=SOFTWARE,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True, timeout=120)
+
+
+def test_web_latency_bounded_during_twitch_request():
+    r = run_sim("--duration", "20", "--live", "ehajo", "--latency", str(TWITCH_LATENCY),
+                "--probe", "0.1", "--max-latency", str(ALLOWED))
+    assert r.returncode == 0, r.stdout[-2000:]
+    assert "Web-Latenz:" in r.stdout
+
+
+if __name__ == "__main__":
+    test_web_latency_bounded_during_twitch_request()
+    print("ok")
@@ -0,0 +1,34 @@
+# TLS-Ersatz für den Simulator. CPythons ssl-Modul bleibt unangetastet (asyncio,
+# urllib usw. brauchen es); nur ssl.create_default_context() liefert im
+# Simulator einen Kontext, der "TLS" zu den lokalen Fake-Servern im Klartext
+# spricht und Hostnamen über socketpool.HOST_MAP umleitet.
+import ssl
+
+import socketpool
+
+
+class _SimTLSSocket:
+    def __init__(self, sock, server_hostname):
+        self._sock = sock
+        self.server_hostname = server_hostname
+
+    def connect(self, address):
+        self._sock.connect(socketpool.resolve(address[0], address[1]))
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class SimSSLContext:
+    handshakes = 0                # Anzahl "TLS-Handshakes" (= neue Verbindungen)
+
+    def wrap_socket(self, sock, server_hostname=None, **kwargs):
+        SimSSLContext.handshakes += 1
+        return _SimTLSSocket(sock, server_hostname)
+
+    def load_verify_locations(self, *args, **kwargs):
+        pass
+
+
+def install():
+    ssl.create_default_context = lambda *args, **kwargs: SimSSLContext()
@@ -0,0 +1,28 @@
+# build_web.py – läuft auf dem PC, NICHT auf dem Pico W.
+# Komprimiert die Web-UI (www/*.html, *.js, *.css) zu *.gz, die code.py direkt
+# aus dem Flash streamt. Nach jeder Änderung an www/ erneut ausführen:
+#
+#   python tools/build_web.py
+#
+import gzip
+import os
+import sys
+
+WWW = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "www")
+SUFFIXES = (".html", ".js", ".css")
+
+def build(www=WWW):
+    for name in sorted(os.listdir(www)):
+        if not name.endswith(SUFFIXES):
+            continue
+        src = os.path.join(www, name)
+        with open(src, "rb") as f:
+            raw = f.read()
+        # mtime=0 -> identische Eingabe ergibt identische .gz (und damit gleiches ETag)
+        data = gzip.compress(raw, compresslevel=9, mtime=0)
+        with open(src + ".gz", "wb") as f:
+            f.write(data)
+        print("%s: %d -> %d Bytes" % (name, len(raw), len(data)))
+
+if __name__ == "__main__":
+    build(sys.argv[1] if len(sys.argv) > 1 else WWW)